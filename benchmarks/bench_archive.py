@@ -0,0 +1,113 @@
+"""Archive throughput and export memory on a large messages table.
+
+Fills messages with --rows rows (the oldest --old share dated a year
+back), then:
+
+- archive: database.archive_messages moves the old rows in batches; the
+  report shows rows/s, main database size before and after (incremental
+  vacuum) and the archive file size;
+- optimize_search: the one-off FTS optimize that drops deleted rows from
+  messages_fts;
+- export: database.export_data streams clients and all messages to
+  gzip parts of EXPORT_PART_MB; peak Python memory is taken with tracemalloc on a second run.
+
+    python -m benchmarks.bench_archive --rows 3000000
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+
+TMP = tempfile.mkdtemp(prefix="bench-archive-")
+os.environ["DB_PATH"] = os.path.join(TMP, "chat.db")
+
+import database  # noqa: E402
+from config import ARCHIVE_PATH  # noqa: E402
+
+USERS = 10_000
+WORDS = "привет заказ оплата доставка вопрос спасибо когда где адрес счёт".split()
+
+
+def fill(conn, rows, old, rnd):
+    conn.executemany(
+        "INSERT INTO clients (user_id, user_name) VALUES (?, ?)",
+        ((uid, f"client {uid}") for uid in range(USERS)),
+    )
+    cutoff = int(rows * old)
+    conn.executemany(
+        "INSERT INTO messages (user_id, sender, text, created_at) VALUES (?, ?, ?, ?)",
+        (
+            (
+                rnd.randrange(USERS),
+                rnd.choice(("client", "admin")),
+                " ".join(rnd.choices(WORDS, k=rnd.randrange(3, 30))),
+                "2020-01-01 00:00:00" if i < cutoff else "2999-01-01 00:00:00",
+            )
+            for i in range(rows)
+        ),
+    )
+    conn.commit()
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+def size(path):
+    return sum(
+        os.path.getsize(path + suffix)
+        for suffix in ("", "-wal")
+        if os.path.exists(path + suffix)
+    ) / 2 ** 20
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--old", type=float, default=0.8)
+    parser.add_argument("--batch", type=int, default=database.ARCHIVE_BATCH)
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(os.environ["DB_PATH"])
+    start = time.perf_counter()
+    fill(conn, args.rows, args.old, random.Random(1))
+    print(f"filled {args.rows} rows in {time.perf_counter() - start:.0f} s, "
+          f"db {size(os.environ['DB_PATH']):.0f} MB")
+
+    before = size(os.environ["DB_PATH"])
+    start = time.perf_counter()
+    moved = await database.archive_messages(30, args.batch)
+    elapsed = time.perf_counter() - start
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    print(f"archive: {moved} rows in {elapsed:.1f} s ({moved / elapsed:.0f} rows/s), "
+          f"batch {args.batch}")
+    print(f"  main db {before:.0f} MB -> {size(os.environ['DB_PATH']):.0f} MB, "
+          f"archive {size(ARCHIVE_PATH):.0f} MB")
+
+    start = time.perf_counter()
+    await database.optimize_search()
+    elapsed = time.perf_counter() - start
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    print(f"optimize_search: {elapsed:.1f} s, main db {size(os.environ['DB_PATH']):.0f} MB")
+
+    for fmt in ("jsonl", "csv"):
+        prefix = os.path.join(TMP, "export")
+        start = time.perf_counter()
+        count, paths = await database.export_data(prefix, fmt)
+        elapsed = time.perf_counter() - start
+        # memory on a separate run: tracemalloc slows the export down several times
+        tracemalloc.start()
+        await database.export_data(prefix, fmt)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"export {fmt}: {count} records in {elapsed:.1f} s, "
+              f"{len(paths)} part(s), {sum(map(os.path.getsize, paths)) / 2 ** 20:.0f} MB, "
+              f"peak memory {peak / 2 ** 20:.1f} MB")
+
+    conn.close()
+    database.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
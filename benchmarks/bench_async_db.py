@@ -0,0 +1,131 @@
+"""Handler latency vs. number of concurrent clients.
+
+Runs the database part of text_handler (is_admin, get_or_create_client,
+save_message, get_admins) for N concurrent clients, once through a blocking
+sqlite3 cursor (the old data layer) and once through the async database
+module. A ticker task measures how long the event loop is stalled.
+
+    python -m benchmarks.bench_async_db
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+
+TMP = tempfile.mkdtemp(prefix="bench-db-")
+os.environ["DB_PATH"] = os.path.join(TMP, "async.db")
+
+import database  # noqa: E402
+from config import ARCHIVE_PATH  # noqa: E402
+
+SEND_DELAY = 0.005  # имитация bot.send_message
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+class SyncRepo:
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        # init_db creates the archive tables in the attached archive database
+        self.conn.execute("ATTACH DATABASE ? AS archive", (ARCHIVE_PATH,))
+        self.cursor = self.conn.cursor()
+        database.init_db(self.conn)
+        self.cursor.execute("INSERT OR IGNORE INTO admins VALUES (1, 1)")
+        self.conn.commit()
+
+    def is_admin(self, user_id):
+        self.cursor.execute("SELECT 1 FROM admins WHERE user_id = ?", (user_id,))
+        return self.cursor.fetchone() is not None
+
+    def get_or_create_client(self, user_id, user_name):
+        self.cursor.execute("SELECT user_id FROM clients WHERE user_id = ?", (user_id,))
+        if not self.cursor.fetchone():
+            self.cursor.execute(
+                "INSERT INTO clients (user_id, user_name) VALUES (?, ?)", (user_id, user_name)
+            )
+            self.conn.commit()
+
+    def save_message(self, user_id, sender, text):
+        self.cursor.execute(
+            "INSERT INTO messages (user_id, sender, text) VALUES (?, ?, ?)", (user_id, sender, text)
+        )
+        self.conn.commit()
+
+    def get_admins(self):
+        self.cursor.execute("SELECT user_id, is_owner FROM admins")
+        return self.cursor.fetchall()
+
+
+async def sync_handler(repo, uid):
+    start = time.perf_counter()
+    if not repo.is_admin(uid):
+        repo.get_or_create_client(uid, f"client {uid}")
+        repo.save_message(uid, "client", "hello")
+        for _ in repo.get_admins():
+            await asyncio.sleep(SEND_DELAY)
+    return time.perf_counter() - start
+
+
+async def async_handler(uid):
+    start = time.perf_counter()
+    if not database.is_admin(uid):
+        await database.get_or_create_client(uid, f"client {uid}")
+        await database.save_message(uid, "client", "hello")
+        for _ in database.get_admins():
+            await asyncio.sleep(SEND_DELAY)
+    return time.perf_counter() - start
+
+
+async def ticker(lags, stop):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.001)
+        lags.append(time.perf_counter() - start - 0.001)
+
+
+async def run_level(make_handler, clients, rounds):
+    lags, stop = [], asyncio.Event()
+    tick = asyncio.create_task(ticker(lags, stop))
+    latencies = []
+    for r in range(rounds):
+        base = 1000 + r * clients
+        latencies += await asyncio.gather(*(make_handler(base + i) for i in range(clients)))
+    stop.set()
+    await tick
+    return latencies, lags or [0.0]
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--levels", default="1,10,50,100,200")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    repo = SyncRepo(os.path.join(TMP, "sync.db"))
+    await database.add_admin(1, owner=True)
+
+    print(f"{'mode':<6} {'clients':>7} {'p50 ms':>8} {'p99 ms':>8} {'loop lag p99 ms':>16}")
+    for clients in map(int, args.levels.split(",")):
+        for mode, handler in (
+            ("sync", lambda uid: sync_handler(repo, uid)),
+            ("async", async_handler),
+        ):
+            latencies, lags = await run_level(handler, clients, args.rounds)
+            print(
+                f"{mode:<6} {clients:>7} "
+                f"{statistics.median(latencies) * 1000:>8.2f} "
+                f"{percentile(latencies, 99) * 1000:>8.2f} "
+                f"{percentile(lags, 99) * 1000:>16.2f}"
+            )
+
+    database.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,92 @@
+"""Client list: full scan vs. keyset pages on 100k clients.
+
+    python -m benchmarks.bench_clients_page --clients 100000
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+TMP = tempfile.mkdtemp(prefix="bench-clients-")
+os.environ["DB_PATH"] = os.path.join(TMP, "clients.db")
+
+import database  # noqa: E402
+
+STATUSES = ("new", "work", "closed")
+
+
+def seed(count):
+    conn = sqlite3.connect(os.environ["DB_PATH"])
+    rnd = random.Random(1)
+    conn.executemany(
+        "INSERT INTO clients (user_id, user_name, status) VALUES (?, ?, ?)",
+        (
+            (uid, f"Client {rnd.randrange(10 ** 6):06d}", rnd.choice(STATUSES))
+            for uid in range(1, count + 1)
+        ),
+    )
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+
+
+def full_scan(status):
+    # старый get_clients на той же таблице, но без индексов
+    conn = sqlite3.connect(os.environ["DB_PATH"])
+    start = time.perf_counter()
+    rows = conn.execute(
+        "SELECT user_id, user_name, status FROM clients NOT INDEXED WHERE status = ? ORDER BY user_name",
+        (status,),
+    ).fetchall()
+    elapsed = time.perf_counter() - start
+    conn.close()
+    return len(rows), elapsed
+
+
+async def walk(status):
+    timings, total, after = [], 0, None
+    while True:
+        start = time.perf_counter()
+        rows, _, has_next = await database.get_clients_page(status, after=after)
+        timings.append(time.perf_counter() - start)
+        total += len(rows)
+        if not has_next:
+            break
+        after = rows[-1][0]
+
+    # и обратно от последней страницы к первой
+    back, before = len(rows), rows[0][0]
+    while True:
+        rows, has_prev, _ = await database.get_clients_page(status, before=before)
+        back += len(rows)
+        if not has_prev:
+            break
+        before = rows[0][0]
+    assert back == total, (back, total)
+    return total, timings
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=100_000)
+    args = parser.parse_args()
+
+    seed(args.clients)
+    count, elapsed = full_scan("new")
+    print(f"full scan (status=new): {count} rows in {elapsed * 1000:.1f} ms")
+
+    total, timings = await walk("new")
+    pages = len(timings)
+    print(f"keyset pages: {pages} pages, {total} rows")
+    for label, index in (("first", 0), ("middle", pages // 2), ("last", pages - 1)):
+        print(f"  {label:<6} page: {timings[index] * 1000:.3f} ms")
+    print(f"  mean   page: {sum(timings) / pages * 1000:.3f} ms")
+
+    database.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
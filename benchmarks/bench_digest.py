@@ -0,0 +1,97 @@
+"""Bot API calls to admins on a bursty workload, digest mode off vs on.
+
+Each client sends a burst of short messages a fraction of a second apart;
+the admins are notified either once per message (DIGEST_WINDOW=0) or with
+one notification per burst that is edited in place.
+
+    python -m benchmarks.bench_digest --clients 20 --burst 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ADMINS = [1, 2, 3]
+
+
+async def child(args):
+    from benchmarks.fake_api import FakeBotAPI, message_update
+
+    api = FakeBotAPI()
+    url = await api.start()
+    os.environ.update(TELEGRAM_API_URL=url)
+    import bot
+    import database
+
+    for uid in ADMINS:
+        await database.add_admin(uid, owner=uid == ADMINS[0])
+
+    update_ids = iter(range(1, 10 ** 9))
+
+    async def client(uid):
+        for i in range(args.burst):
+            await bot.dp.feed_raw_update(bot.bot, message_update(next(update_ids), uid, f"msg {i}"))
+            await asyncio.sleep(args.gap)
+
+    await asyncio.gather(*(client(10_000 + c) for c in range(args.clients)))
+    # дождаться закрытия окон и финальных правок
+    await asyncio.sleep(float(os.environ["DIGEST_WINDOW"]) + float(os.environ["DIGEST_EDIT_DELAY"]) + 1)
+
+    to_admins = [m for _, m, p in api.calls if p.get("chat_id") in ADMINS]
+    print(json.dumps({
+        "sendMessage": to_admins.count("sendMessage"),
+        "editMessageText": to_admins.count("editMessageText"),
+    }))
+    await bot.bot.session.close()
+    await api.stop()
+    database.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--burst", type=int, default=10)
+    parser.add_argument("--gap", type=float, default=0.2, help="seconds between messages in a burst")
+    parser.add_argument("--window", type=float, default=3.0)
+    parser.add_argument("--child", action="store_true")
+    args = parser.parse_args()
+
+    if args.child:
+        asyncio.run(child(args))
+        return
+
+    messages = args.clients * args.burst
+    print(f"{args.clients} clients x {args.burst} messages, {len(ADMINS)} admins")
+    print(f"{'digest':<8} {'send':>6} {'edit':>6} {'total':>6} {'per msg':>8}")
+    results = {}
+    for name, window in (("off", 0.0), ("on", args.window)):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(
+                os.environ,
+                BOT_TOKEN="123456:fake",
+                OWNER_ID=str(ADMINS[0]),
+                DB_PATH=os.path.join(tmp, "digest.db"),
+                DIGEST_WINDOW=str(window),
+                DIGEST_EDIT_DELAY="1",
+                BROADCAST_RATE="100000",
+                BROADCAST_CHAT_RATE="100000",
+            )
+            out = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_digest", "--child",
+                 "--clients", str(args.clients), "--burst", str(args.burst),
+                 "--gap", str(args.gap)],
+                env=env, capture_output=True, text=True, check=True,
+            )
+        calls = json.loads(out.stdout.strip().splitlines()[-1])
+        total = calls["sendMessage"] + calls["editMessageText"]
+        results[name] = total
+        print(f"{name:<8} {calls['sendMessage']:>6} {calls['editMessageText']:>6} "
+              f"{total:>6} {total / messages:>8.2f}")
+    print(f"saved: {1 - results['on'] / results['off']:.0%} of admin-bound API calls")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Write throughput of save_message with group commit on and off.
+
+Each configuration runs in a fresh subprocess, because the batch settings
+are read from the environment when database.py is imported.
+
+    python -m benchmarks.bench_group_commit
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+CONFIGS = [
+    ("off", {"DB_BATCH_SIZE": "1", "DB_FLUSH_INTERVAL_MS": "0"}),
+    ("on", {"DB_BATCH_SIZE": "64", "DB_FLUSH_INTERVAL_MS": "5"}),
+]
+
+
+async def worker(uid, count):
+    import database
+
+    for i in range(count):
+        await database.save_message(uid, "client", f"message {i}")
+
+
+async def run(writers, count):
+    import database
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(uid, count) for uid in range(writers)))
+    elapsed = time.perf_counter() - start
+    database.close()
+    print(f"{writers * count / elapsed:.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--writers", type=int, default=100)
+    parser.add_argument("--messages", type=int, default=50)
+    parser.add_argument("--child", action="store_true")
+    args = parser.parse_args()
+
+    if args.child:
+        asyncio.run(run(args.writers, args.messages))
+        return
+
+    print(f"{'synchronous':<12} {'batching':<9} {'rows/s':>10}")
+    for sync in ("NORMAL", "FULL"):
+        for name, env in CONFIGS:
+            with tempfile.TemporaryDirectory() as tmp:
+                child_env = dict(
+                    os.environ,
+                    DB_PATH=os.path.join(tmp, "bench.db"),
+                    DB_SYNCHRONOUS=sync,
+                    **env,
+                )
+                out = subprocess.run(
+                    [sys.executable, "-m", "benchmarks.bench_group_commit", "--child",
+                     "--writers", str(args.writers), "--messages", str(args.messages)],
+                    env=child_env, capture_output=True, text=True, check=True,
+                )
+            print(f"{sync:<12} {name:<9} {out.stdout.strip():>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Client card history read time as the messages table grows.
+
+For each table size the old query (ORDER BY created_at without an index)
+and the new keyset page on (user_id, id) are timed for the same client.
+
+    python -m benchmarks.bench_history --sizes 100000,1000000,3000000
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+TMP = tempfile.mkdtemp(prefix="bench-history-")
+os.environ["DB_PATH"] = os.path.join(TMP, "history.db")
+
+import database  # noqa: E402
+
+USERS = 10_000
+
+
+def grow(conn, count, rnd):
+    conn.executemany(
+        "INSERT INTO messages (user_id, sender, text) VALUES (?, ?, ?)",
+        (
+            (rnd.randrange(USERS), rnd.choice(("client", "admin")), "x" * rnd.randrange(10, 200))
+            for _ in range(count)
+        ),
+    )
+    conn.commit()
+
+
+def old_history(conn, user_id):
+    start = time.perf_counter()
+    conn.execute(
+        "SELECT sender, text FROM messages NOT INDEXED WHERE user_id = ? "
+        "ORDER BY created_at DESC LIMIT 20",
+        (user_id,),
+    ).fetchall()
+    return time.perf_counter() - start
+
+
+async def new_history(user_id):
+    start = time.perf_counter()
+    rows, has_older = await database.get_history(user_id)
+    first = time.perf_counter() - start
+    start = time.perf_counter()
+    if has_older:
+        await database.get_history(user_id, rows[0][0])
+    return first, time.perf_counter() - start
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="100000,1000000")
+    parser.add_argument("--samples", type=int, default=20)
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(os.environ["DB_PATH"])
+    rnd = random.Random(1)
+    rows = 0
+
+    print(f"{'messages':>10} {'old ms':>8} {'page ms':>8} {'older ms':>9}")
+    for size in map(int, args.sizes.split(",")):
+        grow(conn, size - rows, rnd)
+        rows = size
+        users = [rnd.randrange(USERS) for _ in range(args.samples)]
+        old = statistics.median(old_history(conn, uid) for uid in users[:3])
+        new = [await new_history(uid) for uid in users]
+        print(
+            f"{size:>10} {old * 1000:>8.2f} "
+            f"{statistics.median(t for t, _ in new) * 1000:>8.3f} "
+            f"{statistics.median(t for _, t in new) * 1000:>9.3f}"
+        )
+
+    conn.close()
+    database.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,90 @@
+"""Inbox ("waiting for a reply") read time and trigger write cost.
+
+For each table size the inbox is computed two ways: aggregating messages
+(last message per client, filtered to client senders) and the first page
+of database.get_inbox_page from client_stats. The write column is the
+insert rate into messages with the client_stats trigger in place.
+
+    python -m benchmarks.bench_inbox --sizes 100000,1000000
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+TMP = tempfile.mkdtemp(prefix="bench-inbox-")
+os.environ["DB_PATH"] = os.path.join(TMP, "inbox.db")
+
+import database  # noqa: E402
+
+USERS = 10_000
+
+
+def grow(conn, count, rnd):
+    start = time.perf_counter()
+    conn.executemany(
+        "INSERT INTO messages (user_id, sender, text) VALUES (?, ?, ?)",
+        (
+            (rnd.randrange(USERS), rnd.choice(("client", "admin")), "x" * rnd.randrange(10, 200))
+            for _ in range(count)
+        ),
+    )
+    conn.commit()
+    return count / (time.perf_counter() - start)
+
+
+def old_inbox(conn):
+    start = time.perf_counter()
+    conn.execute(
+        """
+        SELECT m.user_id, c.user_name
+        FROM (SELECT user_id, MAX(id) AS last_id FROM messages GROUP BY user_id) t
+        JOIN messages m ON m.id = t.last_id
+        JOIN clients c ON c.user_id = m.user_id
+        WHERE m.sender = 'client'
+        ORDER BY m.id DESC
+        LIMIT 20
+        """
+    ).fetchall()
+    return time.perf_counter() - start
+
+
+async def new_inbox():
+    start = time.perf_counter()
+    await database.get_inbox_page()
+    return time.perf_counter() - start
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="100000,1000000")
+    parser.add_argument("--samples", type=int, default=20)
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(os.environ["DB_PATH"])
+    conn.executemany(
+        "INSERT INTO clients (user_id, user_name) VALUES (?, ?)",
+        ((uid, f"client {uid}") for uid in range(USERS)),
+    )
+    conn.commit()
+    rnd = random.Random(1)
+    rows = 0
+
+    print(f"{'messages':>10} {'inserts/s':>10} {'aggregate ms':>13} {'inbox ms':>9}")
+    for size in map(int, args.sizes.split(",")):
+        rate = grow(conn, size - rows, rnd)
+        rows = size
+        old = statistics.median(old_inbox(conn) for _ in range(3))
+        new = statistics.median([await new_inbox() for _ in range(args.samples)])
+        print(f"{size:>10} {rate:>10.0f} {old * 1000:>13.2f} {new * 1000:>9.3f}")
+
+    conn.close()
+    database.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
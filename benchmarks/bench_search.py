@@ -0,0 +1,89 @@
+"""FTS5 search vs. LIKE '%...%' on a generated message corpus.
+
+    python -m benchmarks.bench_search --messages 500000
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+TMP = tempfile.mkdtemp(prefix="bench-search-")
+os.environ["DB_PATH"] = os.path.join(TMP, "search.db")
+
+import database  # noqa: E402
+
+WORDS = [
+    "заказ", "доставка", "оплата", "возврат", "скидка", "пицца", "адрес", "курьер",
+    "order", "payment", "refund", "delivery", "invoice", "discount", "address",
+    "спасибо", "когда", "сколько", "почему", "можно", "hello", "thanks", "please",
+]
+QUERIES = ["возврат", "invoice", "курьер адрес", "refu", "w4242", "w17 w99", "несуществующее"]
+
+
+def seed(count, clients):
+    rnd = random.Random(1)
+    vocab = WORDS + [f"w{i}" for i in range(5000)]
+    conn = sqlite3.connect(os.environ["DB_PATH"])
+    conn.executemany(
+        "INSERT INTO clients (user_id, user_name) VALUES (?, ?)",
+        ((uid, f"Client {uid}") for uid in range(clients)),
+    )
+    conn.executemany(
+        "INSERT INTO messages (user_id, sender, text) VALUES (?, 'client', ?)",
+        (
+            (rnd.randrange(clients), " ".join(rnd.choices(vocab, k=rnd.randrange(3, 20))))
+            for _ in range(count)
+        ),
+    )
+    conn.commit()
+    return conn
+
+
+def like_search(conn, query):
+    # как сделали бы без FTS: LIKE по каждому слову
+    where = " AND ".join("m.text LIKE ?" for _ in query.split())
+    return conn.execute(
+        f"""
+        SELECT DISTINCT c.user_id, c.user_name
+        FROM messages m JOIN clients c ON c.user_id = m.user_id
+        WHERE {where}
+        LIMIT 10
+        """,
+        [f"%{w}%" for w in query.split()],
+    ).fetchall()
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=500_000)
+    parser.add_argument("--clients", type=int, default=20_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    conn = seed(args.messages, args.clients)
+    print(f"{args.messages} messages, {args.clients} clients")
+    print(f"{'query':<16} {'LIKE ms':>9} {'FTS5 ms':>9}")
+    for query in QUERIES:
+        like, fts = [], []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            like_search(conn, query)
+            like.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            await database.search(query)
+            fts.append(time.perf_counter() - start)
+        print(
+            f"{query:<16} {statistics.median(like) * 1000:>9.2f} "
+            f"{statistics.median(fts) * 1000:>9.2f}"
+        )
+
+    conn.close()
+    database.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
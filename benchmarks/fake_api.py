@@ -0,0 +1,138 @@
+"""Local stand-in for the Telegram Bot API.
+
+Point the bot at it with TELEGRAM_API_URL=http://127.0.0.1:<port>. Every
+call is recorded, getUpdates long-polls an in-memory queue, and methods
+that return a Message get a plausible one back.
+"""
+import asyncio
+import itertools
+import json
+import time
+
+from aiohttp import web
+
+ME = {"id": 123456, "is_bot": True, "first_name": "Fake", "username": "fake_bot"}
+
+
+def message_update(update_id, user_id, text, name=None, **extra):
+    user = {"id": user_id, "is_bot": False, "first_name": name or f"Client {user_id}"}
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private", "first_name": user["first_name"]},
+        "from": user,
+        "text": text,
+        **extra,
+    }
+    return {"update_id": update_id, "message": message}
+
+
+def callback_update(update_id, user_id, data, message_id=1):
+    user = {"id": user_id, "is_bot": False, "first_name": f"Admin {user_id}"}
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": user,
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": ME,
+                "text": "📋 Клиенты:",
+            },
+        },
+    }
+
+
+class FakeBotAPI:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.updates: asyncio.Queue = asyncio.Queue()
+        self.calls: list[tuple[float, str, dict]] = []
+        self.listeners = []
+        self.message_ids = itertools.count(1)
+        self.failures = {}  # chat_id -> (error_code, description)
+        self.runner = None
+        self.url = None
+
+    # ---- lifecycle ----
+    async def start(self, host: str = "127.0.0.1", port: int = 0):
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{port}"
+        return self.url
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+    def push(self, update: dict):
+        self.updates.put_nowait(update)
+
+    def count(self, *methods: str) -> int:
+        return sum(1 for _, m, _ in self.calls if not methods or m in methods)
+
+    # ---- API ----
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = {}
+        for key, value in (await request.post()).items():
+            try:
+                params[key] = json.loads(value)
+            except (TypeError, ValueError):
+                params[key] = value
+
+        now = time.perf_counter()
+        self.calls.append((now, method, params))
+        for listener in self.listeners:
+            listener(now, method, params)
+
+        failure = self.failures.get(params.get("chat_id"))
+        if failure and method != "getUpdates":
+            code, description = failure
+            body = {"ok": False, "error_code": code, "description": description}
+            if code == 429:
+                body["parameters"] = {"retry_after": 1}
+            return web.json_response(body, status=code)
+
+        if method == "getUpdates":
+            result = await self.get_updates(float(params.get("timeout") or 0))
+        else:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            result = self.result(method, params)
+        return web.json_response({"ok": True, "result": result})
+
+    async def get_updates(self, timeout: float):
+        batch = []
+        try:
+            batch.append(await asyncio.wait_for(self.updates.get(), timeout or 0.01))
+        except asyncio.TimeoutError:
+            return []
+        while not self.updates.empty() and len(batch) < 100:
+            batch.append(self.updates.get_nowait())
+        return batch
+
+    def result(self, method: str, params: dict):
+        if method == "getMe":
+            return ME
+        if method in ("sendMessage", "editMessageText", "editMessageReplyMarkup",
+                      "forwardMessage", "sendDocument", "sendPhoto"):
+            chat_id = params.get("chat_id", 0)
+            return {
+                "message_id": params.get("message_id") or next(self.message_ids),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": ME,
+                "text": params.get("text", ""),
+            }
+        if method == "copyMessage":
+            return {"message_id": next(self.message_ids)}
+        return True
@@ -0,0 +1,191 @@
+"""Offline load test of bot.py against the fake Bot API.
+
+Imports bot.py with TELEGRAM_API_URL pointing at benchmarks.fake_api,
+feeds synthetic traffic (benchmarks.traffic) straight into the
+Dispatcher with the outbox worker running, and reports throughput,
+per-handler latency percentiles, outbox delivery latency (admin reply
+enqueued -> sendMessage to the client), time spent in SQLite and Bot API
+calls by method. Needs no network access.
+
+    python -m benchmarks.load_test --events 2000 --rate 100
+    python -m benchmarks.load_test --max-p99-ms 250   # exit 1 on regression
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict, deque
+
+from benchmarks.fake_api import FakeBotAPI
+from benchmarks.traffic import Scenario
+
+ADMINS = [1, 2, 3]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))] if values else 0.0
+
+
+def timed_handlers(dp, timings):
+    async def middleware(handler, event, data):
+        name = data["handler"].callback.__name__
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            timings[name].append(time.perf_counter() - start)
+
+    dp.message.middleware(middleware)
+    dp.callback_query.middleware(middleware)
+
+
+def timed_database(database, timings):
+    def wrap_read(fn, name):
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                timings[name].append(time.perf_counter() - start)
+        return wrapper
+
+    def submit(job, _submit=database._submit):
+        start = time.perf_counter()
+        future = _submit(job)
+        future.add_done_callback(lambda _: timings["write"].append(time.perf_counter() - start))
+        return future
+
+    database._fetchone = wrap_read(database._fetchone, "read")
+    database._fetchall = wrap_read(database._fetchall, "read")
+    database._read = wrap_read(database._read, "read")
+    database._submit = submit
+
+
+def timed_outbox(bot, api, latencies):
+    # от enqueue_message в relay_to_client до sendMessage клиенту
+    enqueued = defaultdict(deque)
+
+    async def enqueue(user_id, text, *args, _enqueue=bot.enqueue_message):
+        enqueued[user_id, text].append(time.perf_counter())
+        return await _enqueue(user_id, text, *args)
+
+    def on_call(now, method, params):
+        queue = enqueued.get((params.get("chat_id"), params.get("text")))
+        if method == "sendMessage" and queue:
+            latencies.append(now - queue.popleft())
+
+    bot.enqueue_message = enqueue
+    api.listeners.append(on_call)
+    return enqueued
+
+
+async def run(args):
+    api = FakeBotAPI(latency=args.api_latency_ms / 1000)
+    url = await api.start()
+    os.environ.update(
+        BOT_TOKEN="123456:fake",
+        OWNER_ID=str(ADMINS[0]),
+        TELEGRAM_API_URL=url,
+        DB_PATH=os.path.join(tempfile.mkdtemp(prefix="load-"), "load.db"),
+        BROADCAST_RATE=os.environ.get("BROADCAST_RATE", "100000"),
+        BROADCAST_CHAT_RATE=os.environ.get("BROADCAST_CHAT_RATE", "100000"),
+    )
+    import bot
+    import database
+    import digest
+    import outbox
+
+    for uid in ADMINS:
+        await database.add_admin(uid, owner=uid == ADMINS[0])
+
+    handlers, db = defaultdict(list), defaultdict(list)
+    timed_handlers(bot.dp, handlers)
+    timed_database(database, db)
+    deliveries = []
+    enqueued = timed_outbox(bot, api, deliveries)
+    outbox_task = asyncio.create_task(outbox.run_outbox(bot.bot))
+
+    errors = Counter()
+
+    async def feed(updates):
+        for update in updates:
+            try:
+                await bot.dp.feed_raw_update(bot.bot, update)
+            except Exception as e:
+                errors[type(e).__name__] += 1
+
+    scenario = Scenario(admins=ADMINS, rate=args.rate, seed=args.seed)
+    kinds, tasks, updates = Counter(), [], 0
+    start = time.perf_counter()
+    for delay, kind, batch in scenario.events(args.events):
+        await asyncio.sleep(delay)
+        kinds[kind] += 1
+        updates += len(batch)
+        tasks.append(asyncio.create_task(feed(batch)))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+
+    deadline = time.monotonic() + 30
+    while any(enqueued.values()) and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    outbox_task.cancel()
+    await digest.drain()
+    await bot.bot.session.close()
+    await api.stop()
+    database.close()
+
+    # ---- отчёт ----
+    print(f"events: {sum(kinds.values())} ({', '.join(f'{k}={v}' for k, v in kinds.items())})")
+    print(f"updates: {updates} in {elapsed:.2f}s -> {updates / elapsed:.0f} updates/s")
+    print()
+    print(f"{'handler':<16} {'count':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    everything = []
+    for name, values in sorted(handlers.items()):
+        everything += values
+        print(
+            f"{name:<16} {len(values):>6} {percentile(values, 50) * 1000:>8.2f} "
+            f"{percentile(values, 95) * 1000:>8.2f} {percentile(values, 99) * 1000:>8.2f} "
+            f"{max(values) * 1000:>8.2f}"
+        )
+    print()
+    for name, values in sorted(db.items()):
+        print(
+            f"db {name:<6} {len(values):>7} calls, total {sum(values):.3f}s, "
+            f"p50 {percentile(values, 50) * 1000:.2f} ms, p99 {percentile(values, 99) * 1000:.2f} ms"
+        )
+    undelivered = sum(map(len, enqueued.values()))
+    print(
+        f"outbox   {len(deliveries):>7} sent, p50 {percentile(deliveries, 50) * 1000:.2f} ms, "
+        f"p99 {percentile(deliveries, 99) * 1000:.2f} ms, "
+        f"max {max(deliveries, default=0.0) * 1000:.2f} ms, undelivered {undelivered}"
+    )
+    calls = Counter(method for _, method, _ in api.calls)
+    print("api calls: " + ", ".join(f"{m}={c}" for m, c in calls.most_common()))
+    if errors:
+        print("errors: " + ", ".join(f"{e}={c}" for e, c in errors.items()))
+
+    p99 = percentile(everything, 99) * 1000
+    if undelivered:
+        errors["undelivered"] += undelivered
+    if errors or (args.max_p99_ms and p99 > args.max_p99_ms):
+        print(f"FAIL: p99 {p99:.2f} ms (limit {args.max_p99_ms}), errors {sum(errors.values())}")
+        return 1
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=100, help="events per second")
+    parser.add_argument("--api-latency-ms", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--max-p99-ms", type=float, default=0.0)
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
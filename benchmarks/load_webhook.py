@@ -0,0 +1,145 @@
+"""End-to-end latency of polling vs. webhook mode.
+
+Starts a fake Bot API, runs bot.py against it in each mode (one
+subprocess per mode) and injects synthetic client messages: into the
+getUpdates queue for polling, as POSTs to the webhook for webhook mode.
+Latency is measured from injection until the bot confirms the message to
+the client.
+
+    python -m benchmarks.load_webhook --messages 1000 --rate 100
+"""
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+
+from benchmarks.fake_api import FakeBotAPI, message_update
+
+SECRET = "load-test-secret"
+ADMINS = 3
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+async def wait_for(predicate, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise TimeoutError("bot did not start")
+        await asyncio.sleep(0.05)
+
+
+async def run_mode(mode, messages, rate):
+    api = FakeBotAPI()
+    await api.start()
+    port = free_port()
+
+    sent, latencies = {}, []
+
+    def on_call(now, method, params):
+        chat_id = params.get("chat_id")
+        if method == "sendMessage" and chat_id in sent:
+            latencies.append(now - sent.pop(chat_id))
+
+    api.listeners.append(on_call)
+
+    tmp = tempfile.mkdtemp(prefix="load-")
+    env = dict(
+        os.environ,
+        BOT_TOKEN="123456:fake",
+        OWNER_ID="1",
+        DB_PATH=os.path.join(tmp, "load.db"),
+        TELEGRAM_API_URL=api.url,
+        BOT_MODE=mode,
+        WEBHOOK_URL=f"http://127.0.0.1:{port}",
+        WEBHOOK_SECRET=SECRET,
+        WEBAPP_HOST="127.0.0.1",
+        WEBAPP_PORT=str(port),
+        BROADCAST_RATE="100000",
+        BROADCAST_CHAT_RATE="100000",
+    )
+    seed = (
+        "import asyncio, database\n"
+        "async def seed():\n"
+        f"    for uid in range(1, {ADMINS + 1}):\n"
+        "        await database.add_admin(uid, owner=uid == 1)\n"
+        "asyncio.run(seed()); database.close()\n"
+    )
+    subprocess.run([sys.executable, "-c", seed], env=env, check=True)
+    proc = subprocess.Popen([sys.executable, "bot.py"], env=env)
+
+    try:
+        if mode == "webhook":
+            await wait_for(lambda: api.count("setWebhook"))
+        else:
+            await wait_for(lambda: api.count("getUpdates"))
+
+        webhook = f"http://127.0.0.1:{port}/webhook"
+        async with aiohttp.ClientSession() as http:
+            start = time.perf_counter()
+            tasks = []
+            for i in range(messages):
+                uid = 100_000 + i
+                update = message_update(i + 1, uid, f"load message {i}")
+                sent[uid] = time.perf_counter()
+                if mode == "webhook":
+                    tasks.append(asyncio.create_task(http.post(
+                        webhook, json=update,
+                        headers={"X-Telegram-Bot-Api-Secret-Token": SECRET},
+                    )))
+                else:
+                    api.push(update)
+                await asyncio.sleep(max(0.0, start + (i + 1) / rate - time.perf_counter()))
+            for response in await asyncio.gather(*tasks):
+                assert response.status == 200, response.status
+            await wait_for(lambda: not sent, timeout=60)
+            elapsed = time.perf_counter() - start
+
+            if mode == "webhook":
+                async with http.get(f"http://127.0.0.1:{port}/healthz") as r:
+                    assert r.status == 200
+                async with http.post(webhook, json={}) as r:
+                    assert r.status == 401
+    finally:
+        proc.terminate()
+        proc.wait()
+        await api.stop()
+
+    return latencies, elapsed
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=100, help="updates per second")
+    parser.add_argument("--modes", default="polling,webhook")
+    args = parser.parse_args()
+
+    print(f"{'mode':<8} {'updates/s':>10} {'p50 ms':>8} {'p99 ms':>8}")
+    for mode in args.modes.split(","):
+        latencies, elapsed = await run_mode(mode, args.messages, args.rate)
+        print(
+            f"{mode:<8} {len(latencies) / elapsed:>10.0f} "
+            f"{statistics.median(latencies) * 1000:>8.2f} "
+            f"{percentile(latencies, 99) * 1000:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,90 @@
+"""Synthetic client and admin traffic for the load harness.
+
+A Scenario yields (delay, kind, batch) events, where batch is a list of
+updates: the updates of one event are fed in order (one user's actions),
+events themselves overlap.
+"""
+import itertools
+import random
+from dataclasses import dataclass, field
+
+from benchmarks.fake_api import callback_update, message_update
+
+WORDS = [
+    "здравствуйте", "заказ", "доставка", "оплата", "когда", "сколько", "спасибо",
+    "адрес", "возврат", "hello", "order", "please", "status", "invoice",
+]
+
+# вес каждого вида события в общем потоке
+DEFAULT_MIX = {
+    "new_client": 10,
+    "client_message": 40,
+    "burst": 10,
+    "admin_reply": 20,
+    "card_open": 15,
+    "client_list": 5,
+}
+
+
+@dataclass
+class Scenario:
+    admins: list
+    rate: float = 50.0           # событий в секунду
+    mix: dict = field(default_factory=lambda: dict(DEFAULT_MIX))
+    seed: int = 1
+    clients: list = field(default_factory=list)
+
+    def __post_init__(self):
+        self.rnd = random.Random(self.seed)
+        self.update_ids = itertools.count(1)
+        self.client_ids = itertools.count(1_000_000)
+
+    def text(self):
+        return " ".join(self.rnd.choices(WORDS, k=self.rnd.randrange(2, 12)))
+
+    def message(self, user_id, text, name=None):
+        return message_update(next(self.update_ids), user_id, text, name=name)
+
+    def callback(self, user_id, data):
+        return callback_update(next(self.update_ids), user_id, data)
+
+    def client(self):
+        if not self.clients:
+            return self.new_client()[0]["message"]["from"]["id"]
+        return self.rnd.choice(self.clients)
+
+    # ---- события ----
+    def new_client(self):
+        uid = next(self.client_ids)
+        self.clients.append(uid)
+        name = f"Client {uid}"
+        return [self.message(uid, "/start", name), self.message(uid, self.text(), name)]
+
+    def client_message(self):
+        return [self.message(self.client(), self.text())]
+
+    def burst(self):
+        uid = self.client()
+        return [self.message(uid, self.text()) for _ in range(self.rnd.randrange(5, 11))]
+
+    def admin_reply(self):
+        admin, uid = self.rnd.choice(self.admins), self.client()
+        return [
+            self.callback(admin, f"write:{uid}"),
+            self.message(admin, self.text()),
+            self.callback(admin, "finish"),
+        ]
+
+    def card_open(self):
+        return [self.callback(self.rnd.choice(self.admins), f"client:{self.client()}")]
+
+    def client_list(self):
+        admin = self.rnd.choice(self.admins)
+        return [self.message(admin, "📋 Все")]
+
+    def events(self, count):
+        kinds = list(self.mix)
+        weights = [self.mix[k] for k in kinds]
+        for _ in range(count):
+            kind = self.rnd.choices(kinds, weights)[0]
+            yield self.rnd.expovariate(self.rate), kind, getattr(self, kind)()
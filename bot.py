@@ -1,10 +1,21 @@
-import os
 import asyncio
-from dotenv import load_dotenv
+import logging
+import os
+import re
+import shutil
+import signal
+import tempfile
+import time
+from typing import Optional
 
 from aiogram import Bot, Dispatcher, F
-from aiogram.filters import CommandStart
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.filters import Command, CommandObject, CommandStart
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import (
+    FSInputFile,
     Message,
     ReplyKeyboardMarkup,
     KeyboardButton,
@@ -12,6 +23,18 @@ from aiogram.types import (
     InlineKeyboardButton,
 )
 
+from config import (
+    TOKEN,
+    OWNER_ID,
+    TELEGRAM_API_URL,
+    BOT_MODE,
+    UPDATES_CONCURRENCY,
+    INPUT_STATE_TTL,
+    MAINTENANCE_INTERVAL,
+    NOTIFICATION_RETENTION_DAYS,
+    ARCHIVE_AFTER_DAYS,
+    MESSAGE_LIMIT,
+)
 from database import (
     add_admin,
     remove_admin,
@@ -19,30 +42,97 @@ from database import (
     is_owner,
     get_admins,
     get_or_create_client,
-    get_clients,
+    get_clients_page,
+    get_inbox_page,
+    mark_read,
     get_client,
     update_status,
     update_note,
     save_message,
+    enqueue_message,
+    get_notification_client,
+    purge_notifications,
     get_history,
+    search,
+    watch_roles,
+    purge_fsm,
+    archive_messages,
+    export_data,
+    close as close_db,
 )
+from digest import notify_admins, copy_to_admins, drain as drain_digests
+from metrics import setup_metrics, start_metrics_server
+from outbox import run_outbox, notify as notify_outbox
+from storage import SQLiteStorage
+from webhook import check_config as check_webhook_config, run_webhook
 
-# ---------- ENV ----------
-load_dotenv()
-TOKEN = os.getenv("BOT_TOKEN")
-OWNER_ID = int(os.getenv("OWNER_ID"))
+logger = logging.getLogger(__name__)
 
-bot = Bot(token=TOKEN)
-dp = Dispatcher()
+session = None
+if TELEGRAM_API_URL:
+    session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL))
 
 # ---------- STATE ----------
-active_client = {}   # admin_id -> client_id
-waiting_note = {}    # admin_id -> client_id
+# Активный клиент админа хранится в данных FSM (client_id), ожидание
+# ввода — в состоянии, которое истекает через INPUT_STATE_TTL.
+class Input(StatesGroup):
+    note = State()     # data: note_client_id
+    search = State()
+
+# состояния бывают только у админов: клиентские апдейты не ходят в fsm
+storage = SQLiteStorage(
+    state_ttl={Input.note.state: INPUT_STATE_TTL, Input.search.state: INPUT_STATE_TTL},
+    stateless=lambda key: not is_admin(key.user_id),
+)
+
+bot = Bot(token=TOKEN, session=session)
+dp = Dispatcher(storage=storage)
+setup_metrics(dp, bot)
+
+# ---------- MEDIA ----------
+# Между клиентом и админом пересылается текст и всё, что умеет
+# copy_message: файлы не скачиваются и не загружаются заново, в базе
+# остаются только тип и file_id. Служебные сообщения не пересылаются.
+MEDIA_LABELS = {
+    "photo": "📷 Фото",
+    "video": "🎬 Видео",
+    "animation": "🎞 GIF",
+    "document": "📎 Файл",
+    "audio": "🎵 Аудио",
+    "voice": "🎤 Голосовое",
+    "video_note": "⭕️ Видеосообщение",
+    "sticker": "🏷 Стикер",
+    "location": "📍 Геопозиция",
+    "venue": "📍 Место",
+    "contact": "👤 Контакт",
+    "poll": "📊 Опрос",
+    "dice": "🎲 Кубик",
+}
+
+def relayable(message: Message) -> bool:
+    return message.content_type == "text" or message.content_type in MEDIA_LABELS
+
+def media_of(message: Message) -> tuple:
+    # (media_type, file_id, file_unique_id); у текста — (None, None, None)
+    kind = message.content_type
+    if kind not in MEDIA_LABELS:
+        return None, None, None
+    item = getattr(message, kind)
+    if kind == "photo":
+        item = item[-1]  # самый крупный размер
+    return kind, getattr(item, "file_id", None), getattr(item, "file_unique_id", None)
+
+def media_line(media_type, text) -> str:
+    if media_type is None:
+        return text or ""
+    label = MEDIA_LABELS.get(media_type, media_type)
+    return f"{label}: {text}" if text else label
 
 # ---------- MENUS ----------
 main_menu = ReplyKeyboardMarkup(
     keyboard=[
-        [KeyboardButton(text="📋 Клиенты")],
+        [KeyboardButton(text="📥 Входящие"), KeyboardButton(text="📋 Клиенты")],
+        [KeyboardButton(text="🔍 Поиск")],
         [KeyboardButton(text="👥 Админы")],
         [KeyboardButton(text="ℹ️ Помощь")],
         [KeyboardButton(text="🔄 Главное меню")],
@@ -61,22 +151,23 @@ status_menu = ReplyKeyboardMarkup(
 
 # ---------- START ----------
 @dp.message(CommandStart())
-async def start(message: Message):
-    active_client.pop(message.from_user.id, None)
-
-    if message.from_user.id == OWNER_ID:
-        add_admin(OWNER_ID, owner=True)
+async def start(message: Message, state: FSMContext):
+    if message.from_user.id == OWNER_ID and not is_owner(OWNER_ID):
+        await add_admin(OWNER_ID, owner=True)
 
     if is_admin(message.from_user.id):
+        await state.update_data(client_id=None)
         await message.answer("Админ-меню открыто.", reply_markup=main_menu)
     else:
-        get_or_create_client(message.from_user.id, message.from_user.full_name)
+        await get_or_create_client(message.from_user.id, message.from_user.full_name)
         await message.answer("Здравствуйте! Напишите сообщение — администратор ответит.")
 
 # ---------- BACK ----------
 @dp.message(F.text.in_(["⬅️ Назад", "🔄 Главное меню"]))
-async def back_to_main(message: Message):
-    active_client.pop(message.from_user.id, None)
+async def back_to_main(message: Message, state: FSMContext, raw_state: Optional[str] = None):
+    await state.update_data(client_id=None)
+    if raw_state == Input.search:
+        await state.set_state(None)
     await message.answer("Главное меню.", reply_markup=main_menu)
 
 # ---------- HELP ----------
@@ -84,9 +175,12 @@ async def back_to_main(message: Message):
 async def help_menu(message: Message):
     await message.answer(
         "📘 Инструкция\n\n"
+        "📥 Входящие — кто ждёт ответа, новые сверху\n"
         "1️⃣ Клиенты — список клиентов\n"
         "2️⃣ Фильтр по статусу\n"
         "3️⃣ Открой клиента → ✉️ Написать\n"
+        "🔍 Поиск — по сообщениям, именам и заметкам (/search запрос)\n"
+        "📎 Фото, файлы и голосовые пересылаются как есть\n"
         "4️⃣ Заверши чат кнопкой ✅\n\n"
         "Reply работает как запасной вариант.",
         reply_markup=main_menu
@@ -104,7 +198,7 @@ async def admins_menu(message: Message):
     for uid, owner in admins:
         text += f"{uid} {'(главный)' if owner else ''}\n"
 
-    text += "\n➕ /add_admin ID\n➖ /del_admin ID"
+    text += "\n➕ /add_admin ID\n➖ /del_admin ID\n📦 /export [jsonl|csv] — выгрузка"
 
     await message.answer(text, reply_markup=main_menu)
 
@@ -114,7 +208,7 @@ async def add_admin_cmd(message: Message):
         return
     try:
         uid = int(message.text.split()[1])
-        add_admin(uid)
+        await add_admin(uid)
         await message.answer("✅ Админ добавлен.", reply_markup=main_menu)
     except:
         await message.answer("❌ Используй: /add_admin ID")
@@ -125,11 +219,41 @@ async def del_admin_cmd(message: Message):
         return
     try:
         uid = int(message.text.split()[1])
-        remove_admin(uid)
+        await remove_admin(uid)
         await message.answer("✅ Админ удалён.", reply_markup=main_menu)
     except:
         await message.answer("❌ Используй: /del_admin ID")
 
+# ---------- EXPORT ----------
+@dp.message(Command("export"))
+async def export_cmd(message: Message, command: CommandObject):
+    if not is_owner(message.from_user.id):
+        return
+    fmt = (command.args or "jsonl").strip().lower()
+    if fmt not in ("jsonl", "csv"):
+        await message.answer("❌ Используй: /export [jsonl|csv]")
+        return
+
+    await message.answer("⏳ Готовлю выгрузку…")
+    workdir = tempfile.mkdtemp(prefix="export-")
+    name = f"export-{time.strftime('%Y%m%d')}"
+    try:
+        count, paths = await export_data(os.path.join(workdir, name), fmt)
+        if not paths:
+            await message.answer("📦 Выгружать нечего.")
+        for i, path in enumerate(paths, 1):
+            caption = f"📦 Часть {i}/{len(paths)}" if len(paths) > 1 else "📦 Выгрузка"
+            if i == len(paths):
+                caption += f", записей: {count}"
+            await message.answer_document(
+                FSInputFile(path, filename=os.path.basename(path)), caption=caption
+            )
+    except Exception as e:
+        logger.exception("Export failed")
+        await message.answer(f"❌ Не удалось выгрузить данные: {str(e)[:300]}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
 # ---------- CLIENTS ----------
 @dp.message(F.text == "📋 Клиенты")
 async def clients_root(message: Message):
@@ -137,25 +261,54 @@ async def clients_root(message: Message):
         return
     await message.answer("Выберите статус:", reply_markup=status_menu)
 
-async def show_clients(message: Message, status=None):
-    clients = get_clients(status)
+async def clients_keyboard(status=None, after=None, before=None):
+    clients, has_prev, has_next = await get_clients_page(status, after, before)
     if not clients:
+        return None
+
+    rows = [
+        [InlineKeyboardButton(
+            text=f"{name} ({st})",
+            callback_data=f"client:{uid}"
+        )]
+        for uid, name, st in clients
+    ]
+
+    scope = status or "all"
+    nav = []
+    if has_prev:
+        nav.append(InlineKeyboardButton(text="⬅️", callback_data=f"clients:{scope}:prev:{clients[0][0]}"))
+    if has_next:
+        nav.append(InlineKeyboardButton(text="➡️", callback_data=f"clients:{scope}:next:{clients[-1][0]}"))
+    if nav:
+        rows.append(nav)
+
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+async def show_clients(message: Message, status=None):
+    keyboard = await clients_keyboard(status)
+    if keyboard is None:
         await message.answer("Клиентов нет.", reply_markup=main_menu)
         return
 
-    keyboard = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [InlineKeyboardButton(
-                text=f"{name} ({st})",
-                callback_data=f"client:{uid}"
-            )]
-            for uid, name, st in clients
-        ]
-    )
-
     await message.answer("📋 Клиенты:", reply_markup=keyboard)
     await message.answer("Главное меню.", reply_markup=main_menu)
 
+@dp.callback_query(F.data.startswith("clients:"))
+async def clients_page(callback):
+    await callback.answer()
+    _, scope, direction, uid = callback.data.split(":")
+    status = None if scope == "all" else scope
+    cursor = int(uid)
+
+    if direction == "next":
+        keyboard = await clients_keyboard(status, after=cursor)
+    else:
+        keyboard = await clients_keyboard(status, before=cursor)
+
+    if keyboard is not None:
+        await callback.message.edit_reply_markup(reply_markup=keyboard)
+
 @dp.message(F.text == "🟢 Новые")
 async def show_new(message: Message):
     await show_clients(message, "new")
@@ -172,12 +325,96 @@ async def show_closed(message: Message):
 async def show_all(message: Message):
     await show_clients(message)
 
+# ---------- INBOX ----------
+async def inbox_keyboard(after=None, before=None):
+    clients, has_prev, has_next = await get_inbox_page(after, before)
+    if not clients:
+        return None
+
+    rows = [
+        [InlineKeyboardButton(
+            text=f"{name} ({unread})" if unread else name,
+            callback_data=f"client:{uid}"
+        )]
+        for uid, name, unread, _, _ in clients
+    ]
+
+    nav = []
+    if has_prev:
+        nav.append(InlineKeyboardButton(text="⬅️", callback_data=f"inbox:prev:{clients[0][4]}"))
+    if has_next:
+        nav.append(InlineKeyboardButton(text="➡️", callback_data=f"inbox:next:{clients[-1][4]}"))
+    if nav:
+        rows.append(nav)
+
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+@dp.message(F.text == "📥 Входящие")
+async def show_inbox(message: Message):
+    if not is_admin(message.from_user.id):
+        return
+    keyboard = await inbox_keyboard()
+    if keyboard is None:
+        await message.answer("Все клиенты получили ответ.", reply_markup=main_menu)
+        return
+
+    await message.answer("📥 Ждут ответа:", reply_markup=keyboard)
+
+@dp.callback_query(F.data.startswith("inbox:"))
+async def inbox_page(callback):
+    await callback.answer()
+    _, direction, cursor = callback.data.split(":")
+    cursor = int(cursor)
+
+    if direction == "next":
+        keyboard = await inbox_keyboard(after=cursor)
+    else:
+        keyboard = await inbox_keyboard(before=cursor)
+
+    if keyboard is not None:
+        await callback.message.edit_reply_markup(reply_markup=keyboard)
+
+# ---------- SEARCH ----------
+@dp.message(F.text == "🔍 Поиск")
+async def search_start(message: Message, state: FSMContext):
+    if not is_admin(message.from_user.id):
+        return
+    await state.set_state(Input.search)
+    await message.answer("🔍 Введите запрос: текст сообщения, имя или заметка.")
+
+@dp.message(Command("search"))
+async def search_cmd(message: Message, command: CommandObject):
+    if not is_admin(message.from_user.id):
+        return
+    if not command.args:
+        await message.answer("❌ Используй: /search запрос")
+        return
+    await show_search(message, command.args)
+
+async def show_search(message: Message, query: str):
+    results = await search(query)
+    if not results:
+        await message.answer("Ничего не найдено.", reply_markup=main_menu)
+        return
+
+    text = "🔍 Найдено:\n\n" + "\n\n".join(
+        f"👤 {name}\n{snippet}" for _, name, snippet, _ in results
+    )
+    keyboard = InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text=name, callback_data=f"client:{uid}")]
+            for uid, name, _, _ in results
+        ]
+    )
+    await message.answer(split_text([text])[0], reply_markup=keyboard)
+
 # ---------- CLIENT CARD ----------
 @dp.callback_query(F.data.startswith("client:"))
 async def client_card(callback):
     await callback.answer()
     user_id = int(callback.data.split(":")[1])
-    name, status, note = get_client(user_id)
+    name, status, note = await get_client(user_id)
+    read = mark_read(user_id)
 
     keyboard = InlineKeyboardMarkup(
         inline_keyboard=[
@@ -197,85 +434,223 @@ async def client_card(callback):
         reply_markup=keyboard
     )
 
-    history = get_history(user_id)
-    if history:
-        await callback.message.answer(
-            "\n".join(
-                [("👤 " if s == "client" else "🧑‍💼 ") + m for s, m in history]
-            )
+    await send_history(callback.message, user_id)
+    await read
+
+@dp.callback_query(F.data.startswith("history:"))
+async def older_history(callback):
+    await callback.answer()
+    _, user_id, before_id = callback.data.split(":")
+    await send_history(callback.message, int(user_id), int(before_id))
+
+# ---------- HISTORY ----------
+DELIVERY_MARKS = {"pending": "⏳ ", "failed": "❌ "}
+
+def split_text(lines, limit=MESSAGE_LIMIT):
+    chunks, current = [], ""
+    for line in lines:
+        while len(line) > limit:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(line[:limit])
+            line = line[limit:]
+        if current and len(current) + 1 + len(line) > limit:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n{line}" if current else line
+    if current:
+        chunks.append(current)
+    return chunks
+
+async def send_history(message: Message, user_id: int, before_id=None):
+    history, has_older = await get_history(user_id, before_id)
+    if not history:
+        if before_id is not None:
+            await message.answer("Более ранних сообщений нет.")
+        return
+
+    chunks = split_text([
+        ("👤 " if s == "client" else "🧑‍💼 ") + DELIVERY_MARKS.get(d, "") + media_line(t, m)
+        for _, s, m, d, t in history
+    ])
+    keyboard = None
+    if has_older:
+        keyboard = InlineKeyboardMarkup(
+            inline_keyboard=[[InlineKeyboardButton(
+                text="⬆️ Ранее",
+                callback_data=f"history:{user_id}:{history[0][0]}"
+            )]]
         )
 
+    for i, chunk in enumerate(chunks):
+        last = i == len(chunks) - 1
+        await message.answer(chunk, reply_markup=keyboard if last else None)
+
 # ---------- WRITE ----------
 @dp.callback_query(F.data.startswith("write:"))
-async def write_client(callback):
+async def write_client(callback, state: FSMContext, raw_state: Optional[str] = None):
     await callback.answer()
-    active_client[callback.from_user.id] = int(callback.data.split(":")[1])
+    await state.update_data(client_id=int(callback.data.split(":")[1]))
+    if raw_state is not None:
+        # незаконченный поиск или заметка иначе съели бы сообщение клиенту
+        await state.set_state(None)
     await callback.message.answer("✉️ Введите сообщение для клиента.")
 
 # ---------- FINISH ----------
 @dp.callback_query(F.data == "finish")
-async def finish_chat(callback):
+async def finish_chat(callback, state: FSMContext):
     await callback.answer()
-    active_client.pop(callback.from_user.id, None)
+    await state.update_data(client_id=None)
     await callback.message.answer("✅ Чат завершён.", reply_markup=main_menu)
 
 # ---------- NOTE ----------
 @dp.callback_query(F.data.startswith("note:"))
-async def note_start(callback):
+async def note_start(callback, state: FSMContext):
     await callback.answer()
-    waiting_note[callback.from_user.id] = int(callback.data.split(":")[1])
+    await state.update_data(note_client_id=int(callback.data.split(":")[1]))
+    await state.set_state(Input.note)
     await callback.message.answer("📝 Введите заметку.")
 
 # ---------- TEXT ----------
-@dp.message(F.text & ~F.reply_to_message)
-async def text_handler(message: Message):
-
-    # ---- заметка ----
-    if message.from_user.id in waiting_note:
-        uid = waiting_note.pop(message.from_user.id)
-        update_note(uid, message.text)
-        await message.answer("✅ Заметка сохранена.", reply_markup=main_menu)
+async def relay_to_client(message: Message, client_id: int):
+    media = media_of(message)
+    source = (message.chat.id, message.message_id) if media[0] else (None, None)
+    await enqueue_message(client_id, message.text or message.caption, media, source)
+    notify_outbox()
+
+@dp.message(~F.reply_to_message)
+async def text_handler(message: Message, state: FSMContext, raw_state: Optional[str] = None):
+    if is_admin(message.from_user.id):
+        # состояние уже прочитал FSMContextMiddleware
+        current = raw_state
+        data = await state.get_data()
+
+        if current in (Input.note, Input.search) and message.text is None:
+            await message.answer("❌ Нужен текст.")
+            return
+
+        # ---- заметка ----
+        if current == Input.note:
+            await state.set_state(None)
+            await update_note(data["note_client_id"], message.text)
+            await message.answer("✅ Заметка сохранена.", reply_markup=main_menu)
+            return
+
+        # ---- поиск ----
+        if current == Input.search:
+            await state.set_state(None)
+            await show_search(message, message.text)
+            return
+
+        # ---- сообщение активному клиенту ----
+        if data.get("client_id") and relayable(message):
+            await relay_to_client(message, data["client_id"])
+            await message.answer("✅ Сообщение отправлено.", reply_markup=main_menu)
         return
 
-    # ---- сообщение активному клиенту ----
-    if message.from_user.id in active_client:
-        uid = active_client[message.from_user.id]
-        save_message(uid, "admin", message.text)
-        await bot.send_message(uid, message.text)
-        await message.answer("✅ Сообщение отправлено.", reply_markup=main_menu)
+    # ---- сообщение от клиента ----
+    if not relayable(message):
         return
+    media = media_of(message)
+    text = message.text or message.caption
+    created = get_or_create_client(message.from_user.id, message.from_user.full_name)
+    saved = save_message(message.from_user.id, "client", text, media)
 
-    # ---- сообщение от клиента ----
-    if not is_admin(message.from_user.id):
-        get_or_create_client(message.from_user.id, message.from_user.full_name)
-        save_message(message.from_user.id, "client", message.text)
-
-        admins = get_admins()
-        for admin_id, _ in admins:
-            await bot.send_message(
-                admin_id,
-                f"📩 Новое сообщение\n"
-                f"{message.from_user.full_name}\n"
-                f"ID: {message.from_user.id}\n\n"
-                f"{message.text}"
-            )
+    await notify_admins(
+        bot, message.from_user.id, message.from_user.full_name, media_line(media[0], text)
+    )
+    if media[0] is not None:
+        await copy_to_admins(bot, message.from_user.id, message.chat.id, message.message_id)
 
-        await message.answer("Сообщение отправлено администратору.")
+    await asyncio.gather(created, saved)
+    await message.answer("Сообщение отправлено администратору.")
 
 # ---------- REPLY ----------
+# Уведомления, отправленные до появления таблицы notifications: только
+# текст самого бота в формате Digest.render, ID — третья строка заголовка.
+# Текст клиента (подписи, копии, история) сюда не попадает, иначе клиент
+# мог бы написать «ID: …» и перенаправить ответ админа.
+CLIENT_ID_RE = re.compile(r"ID: (\d+)")
+
+def legacy_notification_client(replied: Message) -> Optional[int]:
+    if replied.from_user is None or replied.from_user.id != bot.id or not replied.text:
+        return None
+    header = replied.text.split("\n", 3)
+    if len(header) < 3 or not header[0].startswith("📩 Нов"):
+        return None
+    found = CLIENT_ID_RE.fullmatch(header[2])
+    return int(found.group(1)) if found else None
+
 @dp.message(F.reply_to_message)
-async def reply_handler(message: Message):
+async def reply_handler(message: Message, state: FSMContext):
     if not is_admin(message.from_user.id):
+        # клиент ответил (reply) на сообщение бота — это обычное сообщение
+        await text_handler(message, state)
         return
-    if "ID:" not in message.reply_to_message.text:
+    if not relayable(message):
         return
-    uid = int(message.reply_to_message.text.split("ID:")[1].split()[0])
-    save_message(uid, "admin", message.text)
-    await bot.send_message(uid, message.text)
+    replied = message.reply_to_message
+    uid = await get_notification_client(message.chat.id, replied.message_id)
+    if uid is None:
+        uid = legacy_notification_client(replied)
+    if uid is None:
+        await message.answer("❌ Не удалось определить клиента.")
+        return
+    await relay_to_client(message, uid)
 
 # ---------- MAIN ----------
+async def maintenance():
+    while True:
+        await asyncio.sleep(MAINTENANCE_INTERVAL)
+        try:
+            await purge_fsm()
+            await purge_notifications(NOTIFICATION_RETENTION_DAYS)
+            if ARCHIVE_AFTER_DAYS:
+                await archive_messages(ARCHIVE_AFTER_DAYS)
+        except Exception:
+            logger.exception("Maintenance failed")
+
+async def run_polling(stop: asyncio.Event):
+    polling = asyncio.create_task(
+        dp.start_polling(bot, tasks_concurrency_limit=UPDATES_CONCURRENCY, handle_signals=False)
+    )
+    stopping = asyncio.create_task(stop.wait())
+    await asyncio.wait({polling, stopping}, return_when=asyncio.FIRST_COMPLETED)
+    stopping.cancel()
+    if not polling.done():
+        await dp.stop_polling()
+    await polling
+
 async def main():
-    await dp.start_polling(bot)
+    if BOT_MODE == "webhook":
+        check_webhook_config()
+    # SIGTERM/SIGINT в обоих режимах только останавливают приём апдейтов,
+    # дальше выполняется finally: дописать дайджесты и закрыть базу
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    roles_task = asyncio.create_task(watch_roles())
+    maintenance_task = asyncio.create_task(maintenance())
+    outbox_task = asyncio.create_task(run_outbox(bot))
+    metrics_runner = await start_metrics_server()
+    try:
+        if BOT_MODE == "webhook":
+            await run_webhook(dp, bot, stop)
+        else:
+            await run_polling(stop)
+    finally:
+        roles_task.cancel()
+        maintenance_task.cancel()
+        outbox_task.cancel()
+        await drain_digests()
+        # polling закрывает сессию сам, но последние правки могли открыть её снова
+        await bot.session.close()
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        close_db()
 
 if __name__ == "__main__":
     asyncio.run(main())
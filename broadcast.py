@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import random
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Iterable, Optional
+
+from aiogram.exceptions import (
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+
+from config import (
+    BROADCAST_RATE,
+    BROADCAST_CHAT_RATE,
+    BROADCAST_RETRIES,
+    BROADCAST_BACKOFF,
+    BROADCAST_MAX_WAIT,
+)
+
+logger = logging.getLogger(__name__)
+
+
+# ---------- RATE LIMIT ----------
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = 0.0
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def idle(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.burst and now >= self.paused_until
+
+    def pause(self, seconds: float):
+        now = asyncio.get_running_loop().time()
+        self.paused_until = max(self.paused_until, now + seconds)
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            self._refill(now)
+            if now >= self.paused_until and self.tokens >= 1:
+                self.tokens -= 1
+                return
+            wait = max(self.paused_until - now, (1 - self.tokens) / self.rate)
+            await asyncio.sleep(wait)
+
+
+# Общий лимит Telegram (~30 сообщений в секунду на бота) и лимит на один чат.
+_global = TokenBucket(BROADCAST_RATE, BROADCAST_RATE)
+_chats: dict[int, TokenBucket] = {}
+
+
+def _chat_bucket(chat_id: int) -> TokenBucket:
+    bucket = _chats.get(chat_id)
+    if bucket is None:
+        if len(_chats) > 10_000:
+            now = asyncio.get_running_loop().time()
+            for cid in [cid for cid, b in _chats.items() if b.idle(now)]:
+                del _chats[cid]
+        bucket = _chats[chat_id] = TokenBucket(BROADCAST_CHAT_RATE, 3)
+    return bucket
+
+
+# ---------- SEND ----------
+@dataclass
+class Delivery:
+    chat_id: int
+    result: Any = None
+    error: Optional[Exception] = None
+    attempts: int = 0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+async def deliver(
+    chat_id: int,
+    send: Callable[[int], Awaitable[Any]],
+    max_wait: float = BROADCAST_MAX_WAIT,
+) -> Delivery:
+    # Ожидание по retry_after и паузам лимитов ограничено max_wait: после
+    # него доставка возвращается неуспешной (ошибка TelegramRetryAfter или
+    # TimeoutError), и вызывающий решает, когда повторить. Outbox передаёт
+    # срок меньше claim, чтобы не отправить после того, как задание заберёт
+    # другой процесс.
+    loop = asyncio.get_running_loop()
+    delivery = Delivery(chat_id)
+    bucket = _chat_bucket(chat_id)
+    deadline = loop.time() + max_wait
+
+    while True:
+        if max(bucket.paused_until, _global.paused_until) > deadline:
+            break
+        await bucket.acquire()
+        await _global.acquire()
+        if loop.time() > deadline:
+            break
+        delivery.attempts += 1
+        try:
+            delivery.result = await send(chat_id)
+            delivery.error = None
+            return delivery
+        except TelegramRetryAfter as e:
+            # retry_after не считается попыткой: Telegram сам сказал, когда можно.
+            delivery.attempts -= 1
+            delivery.error = e
+            _global.pause(e.retry_after)
+            bucket.pause(e.retry_after)
+        except (TelegramNetworkError, TelegramServerError) as e:
+            delivery.error = e
+            if delivery.attempts > BROADCAST_RETRIES:
+                break
+            backoff = BROADCAST_BACKOFF * 2 ** (delivery.attempts - 1)
+            await asyncio.sleep(backoff * random.uniform(0.5, 1.5))
+        except Exception as e:
+            delivery.error = e
+            break
+
+    if delivery.error is None:
+        delivery.error = asyncio.TimeoutError(f"not sent within {max_wait:.0f} s")
+    logger.warning("Delivery to %s failed after %s attempts: %r",
+                   chat_id, delivery.attempts, delivery.error)
+    return delivery
+
+
+async def broadcast(
+    chat_ids: Iterable[int],
+    send: Callable[[int], Awaitable[Any]],
+) -> list[Delivery]:
+    return await asyncio.gather(*(deliver(chat_id, send) for chat_id in chat_ids))
@@ -0,0 +1,76 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# ---------- BOT ----------
+TOKEN = os.getenv("BOT_TOKEN")
+OWNER_ID = int(os.getenv("OWNER_ID", "0"))
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")  # свой Bot API сервер
+MESSAGE_LIMIT = 4096  # символов в одном сообщении Telegram
+
+# ---------- DATABASE ----------
+DB_PATH = os.getenv("DB_PATH", "chat.db")
+DB_READERS = int(os.getenv("DB_READERS", "4"))
+DB_SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS", "NORMAL")
+DB_BATCH_SIZE = int(os.getenv("DB_BATCH_SIZE", "64"))
+DB_FLUSH_INTERVAL_MS = float(os.getenv("DB_FLUSH_INTERVAL_MS", "5"))
+
+# ---------- BROADCAST ----------
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "30"))
+BROADCAST_CHAT_RATE = float(os.getenv("BROADCAST_CHAT_RATE", "1"))
+BROADCAST_RETRIES = int(os.getenv("BROADCAST_RETRIES", "3"))
+BROADCAST_BACKOFF = float(os.getenv("BROADCAST_BACKOFF", "0.5"))
+BROADCAST_MAX_WAIT = float(os.getenv("BROADCAST_MAX_WAIT", "60"))  # сек flood-wait на одну доставку
+
+# ---------- ROLES ----------
+ROLES_POLL_INTERVAL = float(os.getenv("ROLES_POLL_INTERVAL", "1"))
+
+# ---------- UI ----------
+CLIENTS_PAGE_SIZE = int(os.getenv("CLIENTS_PAGE_SIZE", "20"))
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "20"))
+INBOX_PAGE_SIZE = int(os.getenv("INBOX_PAGE_SIZE", "20"))
+SEARCH_LIMIT = int(os.getenv("SEARCH_LIMIT", "10"))
+
+# ---------- UPDATES ----------
+BOT_MODE = os.getenv("BOT_MODE", "polling")  # polling | webhook
+UPDATES_CONCURRENCY = int(os.getenv("UPDATES_CONCURRENCY", "64"))
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBAPP_HOST = os.getenv("WEBAPP_HOST", "0.0.0.0")
+WEBAPP_PORT = int(os.getenv("WEBAPP_PORT", "8080"))
+
+# ---------- STATE ----------
+INPUT_STATE_TTL = float(os.getenv("INPUT_STATE_TTL", "900"))  # ожидание заметки/поиска, сек
+MAINTENANCE_INTERVAL = float(os.getenv("MAINTENANCE_INTERVAL", "60"))
+NOTIFICATION_RETENTION_DAYS = float(os.getenv("NOTIFICATION_RETENTION_DAYS", "30"))
+
+# ---------- METRICS ----------
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # 0 — без /metrics
+SLOW_UPDATE_MS = float(os.getenv("SLOW_UPDATE_MS", "0"))  # 0 — не логировать
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))  # доля апдейтов, на время которых cProfile пишет весь event loop
+
+# ---------- OUTBOX ----------
+OUTBOX_CONCURRENCY = int(os.getenv("OUTBOX_CONCURRENCY", "16"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "5"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "10"))
+OUTBOX_RETRY_DELAY = float(os.getenv("OUTBOX_RETRY_DELAY", "5"))
+OUTBOX_CLAIM_TTL = float(os.getenv("OUTBOX_CLAIM_TTL", "300"))  # сек на отправку одного задания
+
+# ---------- DIGEST ----------
+DIGEST_WINDOW = float(os.getenv("DIGEST_WINDOW", "3"))  # сек тишины до закрытия; 0 — без склейки
+DIGEST_EDIT_DELAY = float(os.getenv("DIGEST_EDIT_DELAY", "1"))
+
+# ---------- ARCHIVE ----------
+ARCHIVE_PATH = os.getenv("ARCHIVE_PATH", os.path.splitext(DB_PATH)[0] + "-archive.db")
+ARCHIVE_AFTER_DAYS = float(os.getenv("ARCHIVE_AFTER_DAYS", "0"))  # 0 — не архивировать
+ARCHIVE_BATCH = int(os.getenv("ARCHIVE_BATCH", "1000"))
+VACUUM_PAGES = int(os.getenv("VACUUM_PAGES", "2000"))  # страниц за одну задачу писателя
+
+# ---------- EXPORT ----------
+# Bot API принимает документы до 50 МБ, поэтому /export режется на части.
+# Со своим Bot API сервером (TELEGRAM_API_URL) лимит 2000 МБ — часть можно
+# увеличить.
+EXPORT_PART_MB = float(os.getenv("EXPORT_PART_MB", "45"))
@@ -1,147 +1,1214 @@
+import asyncio
+import csv
+import gzip
+import io
+import json
+import logging
+import queue
 import sqlite3
+import threading
+import time
+import zlib
+from collections import Counter
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor
 
-conn = sqlite3.connect("chat.db", check_same_thread=False)
-cursor = conn.cursor()
-
-# ---- ADMINS ----
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS admins (
-    user_id INTEGER PRIMARY KEY,
-    is_owner INTEGER DEFAULT 0
-)
-""")
-
-# ---- CLIENTS ----
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS clients (
-    user_id INTEGER PRIMARY KEY,
-    user_name TEXT,
-    status TEXT DEFAULT 'new',
-    note TEXT DEFAULT ''
+from metrics import timed
+from config import (
+    DB_PATH,
+    DB_READERS,
+    DB_SYNCHRONOUS,
+    DB_BATCH_SIZE,
+    DB_FLUSH_INTERVAL_MS,
+    ROLES_POLL_INTERVAL,
+    CLIENTS_PAGE_SIZE,
+    HISTORY_PAGE_SIZE,
+    SEARCH_LIMIT,
+    INBOX_PAGE_SIZE,
+    ARCHIVE_PATH,
+    ARCHIVE_BATCH,
+    VACUUM_PAGES,
+    EXPORT_PART_MB,
 )
-""")
-
-# ---- MESSAGES ----
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS messages (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    user_id INTEGER,
-    sender TEXT,
-    text TEXT,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-)
-""")
 
-conn.commit()
+logger = logging.getLogger(__name__)
 
 
-# ---------- ADMINS ----------
-def add_admin(user_id: int, owner: bool = False):
-    cursor.execute(
-        "INSERT OR IGNORE INTO admins (user_id, is_owner) VALUES (?, ?)",
-        (user_id, int(owner))
+# ---------- CONNECTIONS ----------
+# Один поток-писатель и небольшой пул читателей, у каждого потока своё
+# соединение. В режиме WAL читатели не блокируются писателем, а event loop
+# aiogram не ждёт ни запросов, ни commit.
+def connect(path: str = DB_PATH) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    # Место, освобождённое архивацией, возвращает incremental_vacuum. Новой
+    # базе режим задаётся до перехода в WAL, существующую нужно один раз
+    # перестроить: python manage.py vacuum.
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA synchronous={DB_SYNCHRONOUS}")
+    # старые сообщения живут в отдельном файле (см. ARCHIVE)
+    conn.execute("ATTACH DATABASE ? AS archive", (ARCHIVE_PATH,))
+    conn.execute("PRAGMA archive.journal_mode=WAL")
+    conn.execute(f"PRAGMA archive.synchronous={DB_SYNCHRONOUS}")
+    return conn
+
+
+def _incremental_vacuum(conn: sqlite3.Connection) -> bool:
+    return conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+
+
+_local = threading.local()
+
+
+def _open_reader():
+    _local.conn = connect()
+    _local.conn.execute("PRAGMA query_only=1")
+
+
+_readers = ThreadPoolExecutor(DB_READERS, "db-reader", initializer=_open_reader)
+
+
+def _run_fetchone(sql: str, params: tuple):
+    return _local.conn.execute(sql, params).fetchone()
+
+
+def _run_fetchall(sql: str, params: tuple):
+    return _local.conn.execute(sql, params).fetchall()
+
+
+async def _fetchone(sql: str, params: tuple = ()):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_readers, _run_fetchone, sql, params)
+
+
+async def _fetchall(sql: str, params: tuple = ()):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_readers, _run_fetchall, sql, params)
+
+
+async def _read(fn, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_readers, lambda: fn(_local.conn, *args))
+
+
+# ---------- GROUP COMMIT ----------
+# Записи попадают в очередь, поток-писатель забирает до DB_BATCH_SIZE
+# задач (или сколько успело прийти за DB_FLUSH_INTERVAL_MS) и выполняет их
+# одной транзакцией: один commit на пачку вместо commit на каждую строку.
+# Одиночная запись при пустой очереди коммитится сразу, без ожидания.
+# Каждая задача идёт под своим SAVEPOINT, ошибка одной не откатывает
+# остальные. Future задачи завершается только после COMMIT, поэтому после
+# `await save_message(...)` строка видна читателям и переживает падение
+# процесса; при synchronous=NORMAL (DB_SYNCHRONOUS) последние транзакции
+# может потерять только сбой ОС или питания, для этого нужен FULL.
+# Задача, чей ожидающий отменён до начала записи, пропускается; отменённый
+# после — всё равно выполняется, результат просто никто не заберёт.
+_queue = queue.Queue()
+
+
+def _collect_batch():
+    first = _queue.get()
+    if first is None:
+        return None
+    batch = [first]
+    if _queue.empty():
+        return batch
+    deadline = time.monotonic() + DB_FLUSH_INTERVAL_MS / 1000
+    while len(batch) < DB_BATCH_SIZE:
+        timeout = deadline - time.monotonic()
+        try:
+            item = _queue.get(timeout=timeout) if timeout > 0 else _queue.get_nowait()
+        except queue.Empty:
+            break
+        if item is None:
+            _queue.put(None)
+            break
+        batch.append(item)
+    return batch
+
+
+def _resolve(future: Future, result=None, error=None):
+    if future.done():
+        return
+    try:
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+    except InvalidStateError:
+        pass
+
+
+def _flush(conn: sqlite3.Connection, batch: list):
+    results = []
+    conn.execute("BEGIN IMMEDIATE")
+    for job, future in batch:
+        if not future.set_running_or_notify_cancel():
+            continue
+        conn.execute("SAVEPOINT job")
+        try:
+            results.append((future, job(conn), None))
+        except Exception as e:
+            conn.execute("ROLLBACK TO job")
+            results.append((future, None, e))
+        conn.execute("RELEASE job")
+    conn.execute("COMMIT")
+
+    for future, result, error in results:
+        _resolve(future, result, error)
+
+
+def _writer_loop():
+    conn = connect()
+    conn.isolation_level = None
+    while True:
+        batch = _collect_batch()
+        if batch is None:
+            break
+        try:
+            _flush(conn, batch)
+        except Exception as e:
+            logger.exception("Write batch failed")
+            try:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+            except sqlite3.Error:
+                logger.exception("Rollback failed")
+            for _, future in batch:
+                _resolve(future, error=e)
+    conn.close()
+    # записи, успевшие встать в очередь одновременно с close()
+    while True:
+        try:
+            item = _queue.get_nowait()
+        except queue.Empty:
+            break
+        if item is not None:
+            _resolve(item[1], error=RuntimeError("database is closed"))
+
+
+_writer = threading.Thread(target=_writer_loop, name="db-writer", daemon=True)
+_closed = threading.Event()
+
+
+def _submit(job) -> asyncio.Future:
+    future = Future()
+    if _closed.is_set():
+        # после close() писателя нет: ожидание такой записи не закончилось бы
+        future.set_exception(RuntimeError("database is closed"))
+    else:
+        _queue.put((job, future))
+    return asyncio.wrap_future(future)
+
+
+def _execute(sql: str, params: tuple = ()) -> asyncio.Future:
+    return _submit(lambda conn: conn.execute(sql, params).rowcount)
+
+
+def close():
+    _closed.set()
+    _queue.put(None)
+    _writer.join()
+    _readers.shutdown(wait=True)
+
+
+# ---------- SCHEMA ----------
+def init_db(conn: sqlite3.Connection):
+    # ---- ADMINS ----
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS admins (
+        user_id INTEGER PRIMARY KEY,
+        is_owner INTEGER DEFAULT 0
     )
-    conn.commit()
+    """)
 
+    # ---- META ----
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    )
+    """)
+    conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('roles_version', 0)")
 
-def remove_admin(user_id: int):
-    cursor.execute(
-        "DELETE FROM admins WHERE user_id = ? AND is_owner = 0",
-        (user_id,)
+    # Любое изменение admins увеличивает roles_version — по нему кэш ролей
+    # узнаёт о правках, сделанных другими процессами.
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS admins_version_{event.lower()}
+        AFTER {event} ON admins
+        BEGIN
+            UPDATE meta SET value = value + 1 WHERE key = 'roles_version';
+        END
+        """)
+
+    # ---- CLIENTS ----
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS clients (
+        user_id INTEGER PRIMARY KEY,
+        user_name TEXT,
+        status TEXT DEFAULT 'new',
+        note TEXT DEFAULT ''
+    )
+    """)
+
+    # Ключи страниц списка клиентов: (status, user_name, user_id) и
+    # (user_name, user_id) для «Все».
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_clients_status_name ON clients (status, user_name, user_id)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_clients_name ON clients (user_name, user_id)"
+    )
+
+    # ---- MESSAGES ----
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS messages (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        sender TEXT,
+        text TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_messages_user_id ON messages (user_id, id)"
+    )
+    # статус доставки ответов админа: pending | sent | failed
+    _add_column(conn, "messages", "delivery_status", "TEXT")
+    _add_column(conn, "messages", "tg_message_id", "INTEGER")
+    # вложения: тип (photo, voice, document, ...) и file_id Telegram; подпись
+    # хранится в text, чтобы по ней работали поиск и превью
+    _add_column(conn, "messages", "media_type", "TEXT")
+    _add_column(conn, "messages", "file_id", "TEXT")
+    _add_column(conn, "messages", "file_unique_id", "TEXT")
+
+    # ---- ARCHIVE ----
+    # Пачка старых строк messages — одна строка message_chunks (JSON,
+    # сжатый zlib); chunk_users — сколько сообщений клиента в пачке, по
+    # нему история и client_stats находят архивные сообщения клиента.
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS archive.message_chunks (
+        first_id INTEGER PRIMARY KEY,
+        last_id INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        archived_at REAL NOT NULL,
+        data BLOB NOT NULL
+    )
+    """)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS archive.chunk_users (
+        user_id INTEGER NOT NULL,
+        first_id INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (user_id, first_id)
+    ) WITHOUT ROWID
+    """)
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS archive.idx_chunk_users_chunk ON chunk_users (first_id)"
+    )
+
+    # ---- CLIENT STATS ----
+    # Сводка по переписке с каждым клиентом, которую поддерживает триггер на
+    # messages: списки «по последней активности» и «ждут ответа» строятся по
+    # этой таблице, не трогая messages.
+    stats_exist = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'client_stats'"
+    ).fetchone()
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS client_stats (
+        user_id INTEGER PRIMARY KEY,
+        last_message_id INTEGER NOT NULL,
+        last_message_at TIMESTAMP,
+        last_sender TEXT,
+        preview TEXT,
+        unread_by_admin INTEGER NOT NULL DEFAULT 0,
+        total INTEGER NOT NULL DEFAULT 0
+    )
+    """)
+    # «Входящие»: клиенты, чьё сообщение последнее, по убыванию id сообщения
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_client_stats_inbox ON client_stats (last_message_id) "
+        "WHERE last_sender = 'client'"
     )
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS client_stats_ai AFTER INSERT ON messages BEGIN
+        INSERT INTO client_stats
+            (user_id, last_message_id, last_message_at, last_sender, preview, unread_by_admin, total)
+        VALUES
+            (new.user_id, new.id, new.created_at, new.sender,
+             substr(new.text, 1, {PREVIEW_LENGTH}), new.sender = 'client', 1)
+        ON CONFLICT (user_id) DO UPDATE SET
+            last_message_id = excluded.last_message_id,
+            last_message_at = excluded.last_message_at,
+            last_sender = excluded.last_sender,
+            preview = excluded.preview,
+            unread_by_admin = CASE WHEN excluded.last_sender = 'client'
+                                   THEN unread_by_admin + 1 ELSE 0 END,
+            total = total + 1;
+    END
+    """)
+    # существующая база: посчитать сводку по уже накопленным сообщениям
+    if not stats_exist:
+        _rebuild_stats(conn)
+
+    # ---- OUTBOX ----
+    # Очередь исходящих сообщений клиентам: строка живёт, пока сообщение не
+    # доставлено (или не признано недоставляемым).
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        message_id INTEGER NOT NULL,
+        chat_id INTEGER NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at REAL NOT NULL DEFAULT 0
+    )
+    """)
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_outbox_chat ON outbox (chat_id, id)"
+    )
+    # откуда копировать вложение (copy_message): чат и сообщение админа
+    _add_column(conn, "outbox", "from_chat_id", "INTEGER")
+    _add_column(conn, "outbox", "from_message_id", "INTEGER")
+    # до какого времени задание занято отправляющим процессом
+    _add_column(conn, "outbox", "claimed_until", "REAL NOT NULL DEFAULT 0")
+
+    # ---- NOTIFICATIONS ----
+    # Какому клиенту соответствует уведомление, отправленное админу:
+    # ответ (reply) на уведомление находится по первичному ключу.
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS notifications (
+        admin_chat_id INTEGER NOT NULL,
+        message_id INTEGER NOT NULL,
+        client_id INTEGER NOT NULL,
+        created_at REAL NOT NULL,
+        PRIMARY KEY (admin_chat_id, message_id)
+    ) WITHOUT ROWID
+    """)
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_notifications_created ON notifications (created_at)"
+    )
+
+    # ---- FSM ----
+    # Состояния диалогов aiogram (storage.SQLiteStorage): общие для всех
+    # процессов бота. expires_at — срок жизни состояния (ожидание заметки).
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS fsm (
+        key TEXT PRIMARY KEY,
+        state TEXT,
+        data TEXT NOT NULL DEFAULT '{}',
+        expires_at REAL
+    ) WITHOUT ROWID
+    """)
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_fsm_expires ON fsm (expires_at) WHERE expires_at IS NOT NULL"
+    )
+
+    # ---- SEARCH ----
+    # FTS5-индексы поверх messages и clients (external content), триггеры
+    # поддерживают их при save_message, update_note и новых клиентах.
+    _create_fts(conn, "messages_fts", "messages", "id", ("text",))
+    _create_fts(conn, "clients_fts", "clients", "user_id", ("user_name", "note"))
+
     conn.commit()
 
 
-def is_admin(user_id: int) -> bool:
-    cursor.execute(
-        "SELECT 1 FROM admins WHERE user_id = ?",
-        (user_id,)
+def _add_column(conn: sqlite3.Connection, table: str, column: str, decl: str):
+    columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    if column not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+
+def _create_fts(conn: sqlite3.Connection, name: str, table: str, key: str, columns: tuple):
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+    ).fetchone()
+    cols = ", ".join(columns)
+    new_cols = ", ".join(f"new.{c}" for c in columns)
+    old_cols = ", ".join(f"old.{c}" for c in columns)
+
+    conn.execute(f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {name} USING fts5(
+        {cols},
+        content='{table}',
+        content_rowid='{key}',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
     )
-    return cursor.fetchone() is not None
+    """)
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS {name}_ai AFTER INSERT ON {table} BEGIN
+        INSERT INTO {name} (rowid, {cols}) VALUES (new.{key}, {new_cols});
+    END
+    """)
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS {name}_ad AFTER DELETE ON {table} BEGIN
+        INSERT INTO {name} ({name}, rowid, {cols}) VALUES ('delete', old.{key}, {old_cols});
+    END
+    """)
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS {name}_au AFTER UPDATE OF {cols} ON {table} BEGIN
+        INSERT INTO {name} ({name}, rowid, {cols}) VALUES ('delete', old.{key}, {old_cols});
+        INSERT INTO {name} (rowid, {cols}) VALUES (new.{key}, {new_cols});
+    END
+    """)
 
+    # существующая база: проиндексировать то, что было до появления FTS
+    if not exists:
+        conn.execute(f"INSERT INTO {name} ({name}) VALUES ('rebuild')")
 
-def is_owner(user_id: int) -> bool:
-    cursor.execute(
-        "SELECT is_owner FROM admins WHERE user_id = ?",
-        (user_id,)
+
+# ---------- CLIENT STATS ----------
+PREVIEW_LENGTH = 100
+
+# Эталонная сводка, посчитанная по messages: для пересборки и проверки.
+# unread_by_admin — сообщения клиента после последнего ответа админа,
+# total учитывает и архив.
+_STATS_SELECT = f"""
+SELECT t.user_id, m.id, m.created_at, m.sender, substr(m.text, 1, {PREVIEW_LENGTH}),
+       (SELECT COUNT(*) FROM messages u
+        WHERE u.user_id = t.user_id AND u.sender = 'client'
+          AND u.id > COALESCE((SELECT MAX(a.id) FROM messages a
+                               WHERE a.user_id = t.user_id AND a.sender = 'admin'), 0)),
+       t.total + COALESCE((SELECT SUM(a.count) FROM archive.chunk_users a
+                           WHERE a.user_id = t.user_id), 0)
+FROM (
+    SELECT user_id, MAX(id) AS last_id, COUNT(*) AS total
+    FROM messages
+    {{where}}
+    GROUP BY user_id
+) AS t
+JOIN messages m ON m.id = t.last_id
+"""
+
+
+def _rebuild_stats(conn: sqlite3.Connection, user_ids=None):
+    # user_ids=None — вся таблица, иначе только перечисленные клиенты.
+    # Строка клиента, у которого все сообщения уже в архиве, остаётся как есть.
+    where, only, params = "", "", ()
+    if user_ids is not None:
+        where = "WHERE user_id IN (SELECT value FROM json_each(?))"
+        only = "AND user_id IN (SELECT value FROM json_each(?))"
+        params = (json.dumps(list(user_ids)),)
+    conn.execute(
+        f"""
+        DELETE FROM client_stats
+        WHERE user_id NOT IN (SELECT user_id FROM messages)
+          AND user_id NOT IN (SELECT user_id FROM archive.chunk_users)
+          {only}
+        """,
+        params
     )
-    row = cursor.fetchone()
-    return bool(row and row[0])
+    return conn.execute(
+        "INSERT OR REPLACE INTO client_stats "
+        "(user_id, last_message_id, last_message_at, last_sender, preview, unread_by_admin, total) "
+        + _STATS_SELECT.format(where=where),
+        params
+    ).rowcount
 
 
-def get_admins():
-    cursor.execute(
-        "SELECT user_id, is_owner FROM admins"
+def _check_stats(conn: sqlite3.Connection):
+    # Клиенты, чья сводка расходится с messages. unread_by_admin может быть
+    # меньше эталона (админ открыл карточку), но не больше; если часть
+    # переписки в архиве, эталон по messages знает не всё — допуск на
+    # число архивных сообщений.
+    expected = _STATS_SELECT.format(where="")
+    rows = conn.execute(f"""
+        WITH e (user_id, last_id, last_at, sender, preview, unread, total) AS ({expected}),
+             a (user_id, total) AS (
+                SELECT user_id, SUM(count) FROM archive.chunk_users GROUP BY user_id
+             )
+        SELECT e.user_id
+        FROM e
+        LEFT JOIN client_stats s ON s.user_id = e.user_id
+        LEFT JOIN a ON a.user_id = e.user_id
+        WHERE s.user_id IS NULL
+           OR s.last_message_id != e.last_id
+           OR s.last_message_at IS NOT e.last_at
+           OR s.last_sender IS NOT e.sender
+           OR s.preview IS NOT e.preview
+           OR s.total != e.total
+           OR s.unread_by_admin > e.unread + COALESCE(a.total, 0)
+        UNION
+        SELECT user_id FROM client_stats
+        WHERE user_id NOT IN (SELECT user_id FROM e)
+          AND user_id NOT IN (SELECT user_id FROM a)
+    """).fetchall()
+    return [uid for uid, in rows]
+
+
+# ---------- ROLE CACHE ----------
+# Админов единицы, а проверка роли нужна почти на каждом апдейте, поэтому
+# роли держатся в памяти: user_id -> is_owner. add_admin/remove_admin
+# подменяют кэш после commit, watch_roles подхватывает изменения других
+# процессов по roles_version.
+_roles: dict[int, bool] = {}
+_roles_version = -1
+
+
+def _load_roles(conn: sqlite3.Connection):
+    version = conn.execute(
+        "SELECT value FROM meta WHERE key = 'roles_version'"
+    ).fetchone()[0]
+    roles = {
+        uid: bool(owner)
+        for uid, owner in conn.execute("SELECT user_id, is_owner FROM admins")
+    }
+    return version, roles
+
+
+def _apply_roles(snapshot):
+    global _roles, _roles_version
+    version, roles = snapshot
+    if version > _roles_version:
+        _roles_version, _roles = version, roles
+
+
+def _roles_version_changed(conn: sqlite3.Connection) -> bool:
+    row = conn.execute("SELECT value FROM meta WHERE key = 'roles_version'").fetchone()
+    return row[0] != _roles_version
+
+
+async def watch_roles():
+    while True:
+        await asyncio.sleep(ROLES_POLL_INTERVAL)
+        try:
+            if await _read(_roles_version_changed):
+                _apply_roles(await _read(_load_roles))
+        except Exception:
+            logger.exception("Roles poll failed")
+
+
+_setup = connect()
+init_db(_setup)
+_apply_roles(_load_roles(_setup))
+if not _incremental_vacuum(_setup):
+    logger.warning(
+        "auto_vacuum базы не INCREMENTAL: место после архивации не вернётся, "
+        "нужен разовый VACUUM — python manage.py vacuum"
     )
-    return cursor.fetchall()
+_setup.close()
+_writer.start()
+
+
+# ---------- ADMINS ----------
+@timed
+async def add_admin(user_id: int, owner: bool = False):
+    def job(conn):
+        conn.execute(
+            "INSERT OR IGNORE INTO admins (user_id, is_owner) VALUES (?, ?)",
+            (user_id, int(owner))
+        )
+        return _load_roles(conn)
+
+    _apply_roles(await _submit(job))
+
+
+@timed
+async def remove_admin(user_id: int):
+    def job(conn):
+        conn.execute(
+            "DELETE FROM admins WHERE user_id = ? AND is_owner = 0",
+            (user_id,)
+        )
+        return _load_roles(conn)
+
+    _apply_roles(await _submit(job))
+
+
+def is_admin(user_id: int) -> bool:
+    return user_id in _roles
+
+
+def is_owner(user_id: int) -> bool:
+    return _roles.get(user_id, False)
+
+
+def get_admins():
+    return list(_roles.items())
 
 
 # ---------- CLIENTS ----------
+@timed
 def get_or_create_client(user_id: int, user_name: str):
-    cursor.execute("SELECT user_id FROM clients WHERE user_id = ?", (user_id,))
-    if not cursor.fetchone():
-        cursor.execute(
-            "INSERT INTO clients (user_id, user_name) VALUES (?, ?)",
-            (user_id, user_name)
-        )
-        conn.commit()
+    return _execute(
+        "INSERT OR IGNORE INTO clients (user_id, user_name) VALUES (?, ?)",
+        (user_id, user_name)
+    )
 
 
-def get_clients(status=None):
+@timed
+async def get_clients_page(status=None, after=None, before=None, limit: int = CLIENTS_PAGE_SIZE):
+    # Keyset-пагинация по (user_name, user_id): курсор — user_id крайнего
+    # клиента соседней страницы, его ключ достаётся по первичному ключу.
+    # Возвращает (rows, has_prev, has_next).
+    where, params = [], []
     if status:
-        cursor.execute(
-            "SELECT user_id, user_name, status FROM clients WHERE status = ? ORDER BY user_name",
-            (status,)
+        where.append("status = ?")
+        params.append(status)
+    if after is not None:
+        where.append(
+            "(user_name, user_id) > (SELECT user_name, user_id FROM clients WHERE user_id = ?)"
         )
-    else:
-        cursor.execute(
-            "SELECT user_id, user_name, status FROM clients ORDER BY user_name"
+        params.append(after)
+    if before is not None:
+        where.append(
+            "(user_name, user_id) < (SELECT user_name, user_id FROM clients WHERE user_id = ?)"
         )
-    return cursor.fetchall()
+        params.append(before)
+
+    order = "DESC" if before is not None else "ASC"
+    rows = await _fetchall(
+        f"""
+        SELECT user_id, user_name, status
+        FROM clients
+        {"WHERE " + " AND ".join(where) if where else ""}
+        ORDER BY user_name {order}, user_id {order}
+        LIMIT ?
+        """,
+        (*params, limit + 1)
+    )
 
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if before is not None:
+        return rows[::-1], more, True
+    return rows, after is not None, more
 
-def get_client(user_id: int):
-    cursor.execute(
+
+@timed
+async def get_client(user_id: int):
+    return await _fetchone(
         "SELECT user_name, status, note FROM clients WHERE user_id = ?",
         (user_id,)
     )
-    return cursor.fetchone()
 
 
+@timed
 def update_status(user_id: int, status: str):
-    cursor.execute(
+    return _execute(
         "UPDATE clients SET status = ? WHERE user_id = ?",
         (status, user_id)
     )
-    conn.commit()
 
 
+@timed
 def update_note(user_id: int, note: str):
-    cursor.execute(
+    return _execute(
         "UPDATE clients SET note = ? WHERE user_id = ?",
         (note, user_id)
     )
-    conn.commit()
 
 
 # ---------- MESSAGES ----------
-def save_message(user_id: int, sender: str, text: str):
-    cursor.execute(
-        "INSERT INTO messages (user_id, sender, text) VALUES (?, ?, ?)",
-        (user_id, sender, text)
+@timed
+def save_message(user_id: int, sender: str, text: str, media=(None, None, None)):
+    # media: (media_type, file_id, file_unique_id)
+    return _execute(
+        "INSERT INTO messages (user_id, sender, text, media_type, file_id, file_unique_id) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (user_id, sender, text, *media)
     )
-    conn.commit()
 
 
-def get_history(user_id: int, limit: int = 20):
-    cursor.execute(
+def _history(conn: sqlite3.Connection, user_id: int, before_id: int, limit: int):
+    rows = conn.execute(
         """
-        SELECT sender, text
+        SELECT id, sender, text, delivery_status, media_type
         FROM messages
-        WHERE user_id = ?
-        ORDER BY created_at DESC
+        WHERE user_id = ? AND id < ?
+        ORDER BY id DESC
+        LIMIT ?
+        """,
+        (user_id, before_id, limit)
+    ).fetchall()
+    if len(rows) < limit:
+        # горячая таблица кончилась — дочитать из архива
+        oldest = rows[-1][0] if rows else before_id
+        rows += _archived_history(conn, user_id, oldest, limit - len(rows))
+    return rows
+
+
+@timed
+async def get_history(user_id: int, before_id=None, limit: int = HISTORY_PAGE_SIZE):
+    # Страница истории по индексу (user_id, id): последние limit сообщений
+    # с id < before_id. Возвращает (rows, has_older), rows по возрастанию id.
+    if before_id is None:
+        before_id = 2 ** 63 - 1
+    rows = await _read(_history, user_id, before_id, limit + 1)
+    return rows[:limit][::-1], len(rows) > limit
+
+
+# ---------- INBOX ----------
+@timed
+async def get_inbox_page(after=None, before=None, limit: int = INBOX_PAGE_SIZE):
+    # Клиенты, ждущие ответа, новые сверху: keyset по last_message_id из
+    # частичного индекса, курсор — last_message_id крайнего клиента соседней
+    # страницы. Возвращает (rows, has_prev, has_next),
+    # rows: [(user_id, user_name, unread_by_admin, preview, last_message_id)].
+    where, params = ["s.last_sender = 'client'"], []
+    if after is not None:
+        where.append("s.last_message_id < ?")
+        params.append(after)
+    if before is not None:
+        where.append("s.last_message_id > ?")
+        params.append(before)
+
+    order = "ASC" if before is not None else "DESC"
+    rows = await _fetchall(
+        f"""
+        SELECT s.user_id, c.user_name, s.unread_by_admin, s.preview, s.last_message_id
+        FROM client_stats s
+        JOIN clients c ON c.user_id = s.user_id
+        WHERE {" AND ".join(where)}
+        ORDER BY s.last_message_id {order}
+        LIMIT ?
+        """,
+        (*params, limit + 1)
+    )
+
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if before is not None:
+        return rows[::-1], more, True
+    return rows, after is not None, more
+
+
+@timed
+def mark_read(user_id: int):
+    return _execute(
+        "UPDATE client_stats SET unread_by_admin = 0 WHERE user_id = ? AND unread_by_admin > 0",
+        (user_id,)
+    )
+
+
+@timed
+async def check_client_stats():
+    return await _read(_check_stats)
+
+
+@timed
+def rebuild_client_stats(user_ids=None):
+    return _submit(lambda conn: _rebuild_stats(conn, user_ids))
+
+
+# ---------- ARCHIVE ----------
+# Сообщения старше ARCHIVE_AFTER_DAYS переезжают в archive пачками по
+# ARCHIVE_BATCH строк, начиная с самых старых id: каждая пачка — отдельная
+# задача писателя, между ними проходят обычные записи. Освободившиеся
+# страницы отдаются incremental_vacuum, не больше VACUUM_PAGES за задачу
+# (см. vacuum_free). messages и archive — разные
+# файлы и коммитятся по отдельности; пачка записывается по first_id через
+# REPLACE, поэтому повтор после сбоя между двумя commit ничего не
+# дублирует. Архивные сообщения не участвуют в поиске.
+ARCHIVE_COLUMNS = (
+    "id", "user_id", "sender", "text", "created_at", "delivery_status",
+    "tg_message_id", "media_type", "file_id", "file_unique_id",
+)
+
+
+def _archive_batch(conn: sqlite3.Connection, cutoff: str, limit: int) -> int:
+    rows = []
+    for row in conn.execute(
+        f"SELECT {', '.join(ARCHIVE_COLUMNS)} FROM messages ORDER BY id LIMIT ?",
+        (limit,)
+    ):
+        # ещё в outbox — пусть сначала доставится
+        if row[4] >= cutoff or row[5] == "pending":
+            break
+        rows.append(row)
+    if not rows:
+        return 0
+
+    first_id, last_id = rows[0][0], rows[-1][0]
+    conn.execute(
+        "INSERT OR REPLACE INTO archive.message_chunks (first_id, last_id, count, archived_at, data) "
+        "VALUES (?, ?, ?, ?, ?)",
+        (first_id, last_id, len(rows), time.time(),
+         zlib.compress(json.dumps(rows, ensure_ascii=False).encode()))
+    )
+    conn.execute("DELETE FROM archive.chunk_users WHERE first_id = ?", (first_id,))
+    conn.executemany(
+        "INSERT INTO archive.chunk_users (user_id, first_id, count) VALUES (?, ?, ?)",
+        [(uid, first_id, count) for uid, count in Counter(row[1] for row in rows).items()]
+    )
+    conn.execute("DELETE FROM messages WHERE id BETWEEN ? AND ?", (first_id, last_id))
+    _vacuum(conn)
+    return len(rows)
+
+
+def _vacuum(conn: sqlite3.Connection) -> int:
+    # Один PRAGMA на VACUUM_PAGES страниц: каждый шаг incremental_vacuum
+    # освобождает страницу, fetchall прогоняет все шаги. Возвращает, сколько
+    # свободных страниц осталось. На базе без auto_vacuum=INCREMENTAL
+    # pragma ничего не делает — её перестраивает manage.py vacuum.
+    if not _incremental_vacuum(conn):
+        return 0
+    conn.execute(f"PRAGMA incremental_vacuum({VACUUM_PAGES})").fetchall()
+    return conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+
+@timed
+async def vacuum_free():
+    # Вернуть все свободные страницы отдельными задачами писателя, чтобы
+    # обычные записи проходили между ними.
+    while await _submit(_vacuum):
+        pass
+
+
+async def vacuum_enabled() -> bool:
+    return await _read(_incremental_vacuum)
+
+
+def _archived_history(conn: sqlite3.Connection, user_id: int, before_id: int, limit: int):
+    # Архивные сообщения клиента с id < before_id, новые первыми: распаковываются
+    # только пачки, где у клиента есть сообщения.
+    rows = []
+    for data, in conn.execute(
+        """
+        SELECT c.data
+        FROM archive.chunk_users u
+        JOIN archive.message_chunks c ON c.first_id = u.first_id
+        WHERE u.user_id = ? AND u.first_id < ?
+        ORDER BY u.first_id DESC
+        """,
+        (user_id, before_id)
+    ):
+        chunk = json.loads(zlib.decompress(data))
+        rows.extend(
+            (row[0], row[2], row[3], row[5], row[7])
+            for row in reversed(chunk)
+            if row[1] == user_id and row[0] < before_id
+        )
+        if len(rows) >= limit:
+            break
+    return rows[:limit]
+
+
+@timed
+async def archive_messages(days: float, batch: int = ARCHIVE_BATCH):
+    # Возвращает число перенесённых строк.
+    cutoff = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(time.time() - days * 86400))
+    total = 0
+    while True:
+        moved = await _submit(lambda conn: _archive_batch(conn, cutoff, batch))
+        total += moved
+        if moved < batch:
+            await vacuum_free()
+            return total
+
+
+@timed
+async def optimize_search():
+    # Удаление из messages оставляет в messages_fts отметки об удалённых
+    # строках; обычные слияния FTS5 убирают их постепенно, optimize — сразу,
+    # но переписывает весь индекс. Для разовой архивации большого хвоста.
+    await _execute("INSERT INTO messages_fts (messages_fts) VALUES ('optimize')")
+    await vacuum_free()
+
+
+# ---------- EXPORT ----------
+# Выгрузка для владельца: клиенты, затем все сообщения (архив и горячая
+# таблица) по возрастанию id. Строки идут генератором прямо в gzip-файлы,
+# в памяти не больше одной архивной пачки. Читается из одного снимка базы.
+# Когда часть дорастает до EXPORT_PART_MB, начинается следующая.
+EXPORT_FIELDS = (
+    "type", "user_id", "user_name", "status", "note",
+    "id", "sender", "text", "created_at", "delivery_status",
+    "tg_message_id", "media_type", "file_id", "file_unique_id",
+)
+
+
+def _iter_export(conn: sqlite3.Connection):
+    for user_id, user_name, status, note in conn.execute(
+        "SELECT user_id, user_name, status, note FROM clients ORDER BY user_id"
+    ):
+        yield {"type": "client", "user_id": user_id, "user_name": user_name,
+               "status": status, "note": note}
+
+    archived = 0
+    for last_id, data in conn.execute(
+        "SELECT last_id, data FROM archive.message_chunks ORDER BY first_id"
+    ):
+        archived = last_id
+        for row in json.loads(zlib.decompress(data)):
+            yield {"type": "message", **dict(zip(ARCHIVE_COLUMNS, row))}
+
+    # id <= archived — копии после сбоя между commit архива и messages
+    for row in conn.execute(
+        f"SELECT {', '.join(ARCHIVE_COLUMNS)} FROM messages WHERE id > ? ORDER BY id",
+        (archived,)
+    ):
+        yield {"type": "message", **dict(zip(ARCHIVE_COLUMNS, row))}
+
+
+def _export(conn: sqlite3.Connection, prefix: str, fmt: str, part_bytes: int):
+    count, paths = 0, []
+    raw = out = None
+    conn.execute("BEGIN")
+    try:
+        for record in _iter_export(conn):
+            # размер сжатого файла проверяется раз в 1000 записей
+            if out is None or (count % 1000 == 0 and raw.tell() >= part_bytes):
+                if out is not None:
+                    out.close()
+                    raw.close()
+                paths.append(f"{prefix}-{len(paths) + 1}.{fmt}.gz")
+                raw = open(paths[-1], "wb")
+                out = io.TextIOWrapper(
+                    gzip.GzipFile(fileobj=raw, mode="wb"), encoding="utf-8", newline=""
+                )
+                if fmt == "csv":
+                    writer = csv.DictWriter(out, EXPORT_FIELDS)
+                    writer.writeheader()
+                    write = writer.writerow
+                else:
+                    write = lambda record, out=out: out.write(
+                        json.dumps(record, ensure_ascii=False) + "\n"
+                    )
+            write(record)
+            count += 1
+    finally:
+        if out is not None:
+            out.close()
+            raw.close()
+        conn.execute("ROLLBACK")
+    return count, paths
+
+
+@timed
+async def export_data(prefix: str, fmt: str = "jsonl", part_mb: float = EXPORT_PART_MB):
+    # fmt: jsonl | csv. Части — gzip-файлы {prefix}-N.{fmt}.gz.
+    # Возвращает (число записей, пути частей).
+    return await _read(_export, prefix, fmt, int(part_mb * 2 ** 20))
+
+
+# ---------- OUTBOX ----------
+@timed
+def enqueue_message(user_id: int, text: str, media=(None, None, None), source=(None, None)):
+    # Сообщение админа клиенту: строка в messages и задание в outbox
+    # в одной транзакции. Вложение уходит через copy_message из source —
+    # (chat_id, message_id) исходного сообщения админа.
+    def job(conn):
+        message_id = conn.execute(
+            "INSERT INTO messages (user_id, sender, text, media_type, file_id, file_unique_id, delivery_status) "
+            "VALUES (?, 'admin', ?, ?, ?, ?, 'pending')",
+            (user_id, text, *media)
+        ).lastrowid
+        conn.execute(
+            "INSERT INTO outbox (message_id, chat_id, from_chat_id, from_message_id) VALUES (?, ?, ?, ?)",
+            (message_id, user_id, *source)
+        )
+        return message_id
+
+    return _submit(job)
+
+
+@timed
+async def get_outbox(limit: int):
+    # Самое старое задание каждого чата, время которого пришло и которое
+    # никто не занял: следующее сообщение в чат не уходит, пока не
+    # разобрались с предыдущим.
+    now = time.time()
+    return await _fetchall(
+        """
+        SELECT o.id, o.message_id, o.chat_id, o.attempts, m.text,
+               o.from_chat_id, o.from_message_id
+        FROM outbox o
+        JOIN messages m ON m.id = o.message_id
+        WHERE o.id IN (SELECT MIN(id) FROM outbox GROUP BY chat_id)
+          AND o.next_attempt_at <= ?
+          AND o.claimed_until <= ?
+        ORDER BY o.id
+        LIMIT ?
+        """,
+        (now, now, limit)
+    )
+
+
+@timed
+def claim_outbox(outbox_ids: list, ttl: float):
+    # Несколько процессов читают одни и те же головы очередей; отправляет
+    # только тот, чей UPDATE прошёл через писателя первым. Занятость истекает
+    # через ttl — задание упавшего процесса подберёт другой.
+    # Возвращает id, занятые этим вызовом.
+    def job(conn):
+        now = time.time()
+        return [
+            outbox_id for outbox_id in outbox_ids
+            if conn.execute(
+                "UPDATE outbox SET claimed_until = ? WHERE id = ? AND claimed_until <= ?",
+                (now + ttl, outbox_id, now)
+            ).rowcount
+        ]
+
+    return _submit(job)
+
+
+@timed
+def mark_delivered(outbox_id: int, message_id: int, tg_message_id: int):
+    def job(conn):
+        conn.execute("DELETE FROM outbox WHERE id = ?", (outbox_id,))
+        conn.execute(
+            "UPDATE messages SET delivery_status = 'sent', tg_message_id = ? WHERE id = ?",
+            (tg_message_id, message_id)
+        )
+
+    return _submit(job)
+
+
+@timed
+def mark_failed(outbox_id: int, message_id: int):
+    def job(conn):
+        conn.execute("DELETE FROM outbox WHERE id = ?", (outbox_id,))
+        conn.execute(
+            "UPDATE messages SET delivery_status = 'failed' WHERE id = ?",
+            (message_id,)
+        )
+
+    return _submit(job)
+
+
+@timed
+def reschedule(outbox_id: int, attempts: int, next_attempt_at: float):
+    return _execute(
+        "UPDATE outbox SET attempts = ?, next_attempt_at = ?, claimed_until = 0 WHERE id = ?",
+        (attempts, next_attempt_at, outbox_id)
+    )
+
+
+# ---------- NOTIFICATIONS ----------
+@timed
+def save_notifications(rows: list):
+    # rows: [(admin_chat_id, message_id, client_id), ...]
+    now = time.time()
+
+    def job(conn):
+        conn.executemany(
+            "INSERT OR REPLACE INTO notifications (admin_chat_id, message_id, client_id, created_at) "
+            "VALUES (?, ?, ?, ?)",
+            [(*row, now) for row in rows]
+        )
+
+    return _submit(job)
+
+
+@timed
+async def get_notification_client(admin_chat_id: int, message_id: int):
+    row = await _fetchone(
+        "SELECT client_id FROM notifications WHERE admin_chat_id = ? AND message_id = ?",
+        (admin_chat_id, message_id)
+    )
+    return row[0] if row else None
+
+
+@timed
+def purge_notifications(retention_days: float):
+    return _execute(
+        "DELETE FROM notifications WHERE created_at < ?",
+        (time.time() - retention_days * 86400,)
+    )
+
+
+# ---------- FSM ----------
+@timed
+async def get_fsm_state(key: str):
+    row = await _fetchone(
+        "SELECT state FROM fsm WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+        (key, time.time())
+    )
+    return row[0] if row else None
+
+
+@timed
+async def get_fsm_data(key: str):
+    row = await _fetchone(
+        "SELECT data FROM fsm WHERE key = ?",
+        (key,)
+    )
+    return row[0] if row else None
+
+
+@timed
+def set_fsm_state(key: str, state, expires_at=None):
+    return _execute(
+        """
+        INSERT INTO fsm (key, state, expires_at) VALUES (?, ?, ?)
+        ON CONFLICT (key) DO UPDATE SET state = excluded.state, expires_at = excluded.expires_at
+        """,
+        (key, state, expires_at)
+    )
+
+
+@timed
+def set_fsm_data(key: str, data: str):
+    return _execute(
+        """
+        INSERT INTO fsm (key, data) VALUES (?, ?)
+        ON CONFLICT (key) DO UPDATE SET data = excluded.data
+        """,
+        (key, data)
+    )
+
+
+@timed
+async def purge_fsm():
+    # просроченные состояния сбрасываются, пустые записи удаляются
+    def job(conn):
+        now = time.time()
+        conn.execute(
+            "UPDATE fsm SET state = NULL, expires_at = NULL WHERE expires_at <= ?",
+            (now,)
+        )
+        return conn.execute(
+            "DELETE FROM fsm WHERE state IS NULL AND data = '{}'"
+        ).rowcount
+
+    return await _submit(job)
+
+
+# ---------- SEARCH ----------
+def _fts_query(query: str) -> str:
+    # Каждое слово — префиксный терм в кавычках: пользовательский ввод не
+    # интерпретируется как синтаксис FTS5.
+    terms = [t.replace('"', '""') for t in query.split()]
+    return " ".join(f'"{t}"*' for t in terms if t)
+
+
+@timed
+async def search(query: str, limit: int = SEARCH_LIMIT):
+    # Лучшие совпадения по bm25 из сообщений и карточек клиентов,
+    # по одному (лучшему) сниппету на клиента: (user_id, user_name, snippet).
+    match = _fts_query(query)
+    if not match:
+        return []
+    return await _fetchall(
+        """
+        WITH hits AS (
+            SELECT m.user_id AS user_id, f.snippet AS snippet, f.score AS score
+            FROM (
+                SELECT rowid, snippet(messages_fts, 0, '«', '»', '…', 10) AS snippet,
+                       rank AS score
+                FROM messages_fts
+                WHERE messages_fts MATCH ?
+                ORDER BY rank
+                LIMIT ?
+            ) AS f
+            JOIN messages m ON m.id = f.rowid
+            UNION ALL
+            SELECT * FROM (
+                SELECT rowid, snippet(clients_fts, -1, '«', '»', '…', 10), rank
+                FROM clients_fts
+                WHERE clients_fts MATCH ?
+                ORDER BY rank
+                LIMIT ?
+            )
+        )
+        SELECT c.user_id, c.user_name, h.snippet, MIN(h.score)
+        FROM hits h
+        JOIN clients c ON c.user_id = h.user_id
+        GROUP BY c.user_id
+        ORDER BY MIN(h.score)
         LIMIT ?
         """,
-        (user_id, limit)
+        (match, limit * 10, match, limit, limit)
     )
-    return cursor.fetchall()[::-1]
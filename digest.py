@@ -0,0 +1,153 @@
+import asyncio
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+
+from broadcast import broadcast
+from config import DIGEST_WINDOW, DIGEST_EDIT_DELAY, MESSAGE_LIMIT
+from database import get_admins, save_notifications
+
+LINE_LIMIT = 3500  # запас под заголовок, имя и ID
+
+
+# ---------- DIGEST ----------
+# Серия сообщений клиента собирается в одно уведомление на админа: первое
+# сообщение уходит сразу, следующие дописываются правкой того же
+# уведомления (не чаще раза в DIGEST_EDIT_DELAY). Окно закрывается, если
+# клиент молчит DIGEST_WINDOW секунд или текст перестаёт помещаться.
+class Digest:
+    def __init__(self, client_id: int, name: str):
+        self.client_id = client_id
+        self.name = name
+        self.lines: list[str] = []
+        self.shown = 0                     # сколько строк уже видят админы
+        self.messages: dict[int, int] = {}  # admin_chat_id -> message_id
+        self.updated = asyncio.Event()
+        self.closing = asyncio.Event()      # _close: не ждать DIGEST_EDIT_DELAY
+        self.closed = False
+
+    def render(self, lines=None) -> str:
+        lines = self.lines if lines is None else lines
+        title = "📩 Новое сообщение" if len(lines) == 1 else f"📩 Новые сообщения ({len(lines)})"
+        return f"{title}\n{self.name}\nID: {self.client_id}\n\n" + "\n".join(lines)
+
+    def fits(self, text: str) -> bool:
+        return len(self.render(self.lines + [text])) <= MESSAGE_LIMIT
+
+
+_digests: dict[int, Digest] = {}
+_tasks: set[asyncio.Task] = set()
+
+
+async def _send_to(bot: Bot, digest: Digest, chat_ids: list[int], text: str):
+    deliveries = await broadcast(chat_ids, lambda chat_id: bot.send_message(chat_id, text))
+    sent = {d.chat_id: d.result.message_id for d in deliveries if d.ok}
+    digest.messages.update(sent)
+    await save_notifications([
+        (chat_id, message_id, digest.client_id) for chat_id, message_id in sent.items()
+    ])
+
+
+async def _send(bot: Bot, digest: Digest):
+    text = digest.render()
+    digest.shown = len(digest.lines)
+    await _send_to(bot, digest, [admin_id for admin_id, _ in get_admins()], text)
+
+
+async def _edit(bot: Bot, digest: Digest):
+    # Админ, которому уведомление не дошло (или добавленный позже), получает
+    # его заново целиком: правка ему не поможет, а серию он не должен пропустить.
+    missing = [admin_id for admin_id, _ in get_admins() if admin_id not in digest.messages]
+    changed = digest.shown != len(digest.lines)
+    if not changed and not missing:
+        return
+    text = digest.render()
+    digest.shown = len(digest.lines)
+    targets = list(digest.messages) if changed else []
+    if missing:
+        await _send_to(bot, digest, missing, text)
+    if not targets:
+        return
+
+    async def edit(chat_id):
+        try:
+            return await bot.edit_message_text(
+                text, chat_id=chat_id, message_id=digest.messages[chat_id]
+            )
+        except TelegramBadRequest as e:
+            if "not modified" not in str(e):
+                raise
+
+    await broadcast(targets, edit)
+
+
+async def _run(bot: Bot, digest: Digest):
+    try:
+        await _send(bot, digest)
+        while not digest.closed:
+            try:
+                await asyncio.wait_for(digest.updated.wait(), DIGEST_WINDOW)
+            except asyncio.TimeoutError:
+                break
+            digest.updated.clear()
+            try:
+                await asyncio.wait_for(digest.closing.wait(), DIGEST_EDIT_DELAY)
+            except asyncio.TimeoutError:
+                pass
+            await _edit(bot, digest)
+    finally:
+        if _digests.get(digest.client_id) is digest:
+            del _digests[digest.client_id]
+        await _edit(bot, digest)
+
+
+def _close(digest: Digest):
+    digest.closed = True
+    digest.updated.set()
+    digest.closing.set()
+    del _digests[digest.client_id]
+
+
+async def drain():
+    # Перед остановкой: закрыть открытые окна и дождаться последних правок,
+    # пока сессия бота и база ещё живы.
+    for digest in list(_digests.values()):
+        _close(digest)
+    await asyncio.gather(*_tasks, return_exceptions=True)
+
+
+async def copy_to_admins(bot: Bot, client_id: int, from_chat_id: int, message_id: int):
+    # Вложение клиента копируется каждому админу (copy_message, без
+    # скачивания); ответ на копию тоже находит клиента.
+    deliveries = await broadcast(
+        [admin_id for admin_id, _ in get_admins()],
+        lambda chat_id: bot.copy_message(chat_id, from_chat_id, message_id),
+    )
+    await save_notifications([
+        (d.chat_id, d.result.message_id, client_id) for d in deliveries if d.ok
+    ])
+
+
+async def notify_admins(bot: Bot, client_id: int, name: str, text: str):
+    text = text[:LINE_LIMIT]
+    if DIGEST_WINDOW <= 0:
+        digest = Digest(client_id, name)
+        digest.lines.append(text)
+        await _send(bot, digest)
+        return
+
+    digest = _digests.get(client_id)
+    if digest is not None and not digest.fits(text):
+        _close(digest)
+        digest = None
+
+    if digest is None:
+        digest = _digests[client_id] = Digest(client_id, name)
+        digest.lines.append(text)
+        task = asyncio.create_task(_run(bot, digest))
+        _tasks.add(task)
+        task.add_done_callback(_tasks.discard)
+        return
+
+    digest.lines.append(text)
+    digest.updated.set()
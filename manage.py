@@ -0,0 +1,100 @@
+"""Обслуживание базы бота из командной строки.
+
+    python manage.py stats-check [--repair]   сверить client_stats с messages
+    python manage.py stats-rebuild            пересчитать client_stats целиком
+    python manage.py archive --days N         перенести сообщения старше N дней в архив
+                                              и сжать поисковый индекс
+    python manage.py vacuum                   включить auto_vacuum=INCREMENTAL и сжать базу
+
+Работает с той же базой (DB_PATH), что и бот; запускать можно при
+работающем боте (vacuum лучше при остановленном: он перезаписывает файл
+целиком).
+"""
+import argparse
+import asyncio
+
+from config import ARCHIVE_AFTER_DAYS
+from database import (
+    archive_messages,
+    check_client_stats,
+    connect,
+    optimize_search,
+    rebuild_client_stats,
+    vacuum_enabled,
+    close,
+)
+
+
+async def stats_check(repair: bool):
+    broken = await check_client_stats()
+    if not broken:
+        print("client_stats: ok")
+        return 0
+
+    print(f"client_stats: {len(broken)} клиентов расходятся с messages")
+    print(" ".join(map(str, broken[:50])) + (" …" if len(broken) > 50 else ""))
+    if repair:
+        await rebuild_client_stats(broken)
+        print("исправлено")
+        return 0
+    return 1
+
+
+async def stats_rebuild():
+    count = await rebuild_client_stats()
+    print(f"client_stats: пересчитано {count} клиентов")
+    return 0
+
+
+async def archive(days: float):
+    if days <= 0:
+        print("укажите --days или ARCHIVE_AFTER_DAYS")
+        return 2
+    moved = await archive_messages(days)
+    print(f"в архив перенесено {moved} сообщений")
+    if moved:
+        await optimize_search()
+    if not await vacuum_enabled():
+        print("auto_vacuum не INCREMENTAL: файл базы не уменьшится, "
+              "выполните python manage.py vacuum")
+    return 0
+
+
+def vacuum():
+    # Режим auto_vacuum существующей базы меняется только через VACUUM.
+    conn = connect()
+    conn.isolation_level = None
+    before = conn.execute("PRAGMA page_count").fetchone()[0]
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    conn.execute("VACUUM main")
+    after = conn.execute("PRAGMA page_count").fetchone()[0]
+    conn.close()
+    print(f"страниц: {before} -> {after}")
+    return 0
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest="command", required=True)
+    check = commands.add_parser("stats-check")
+    check.add_argument("--repair", action="store_true")
+    commands.add_parser("stats-rebuild")
+    arch = commands.add_parser("archive")
+    arch.add_argument("--days", type=float, default=ARCHIVE_AFTER_DAYS)
+    commands.add_parser("vacuum")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "stats-check":
+            return await stats_check(args.repair)
+        if args.command == "archive":
+            return await archive(args.days)
+        if args.command == "vacuum":
+            return vacuum()
+        return await stats_rebuild()
+    finally:
+        close()
+
+
+if __name__ == "__main__":
+    raise SystemExit(asyncio.run(main()))
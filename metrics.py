@@ -0,0 +1,245 @@
+import asyncio
+import cProfile
+import functools
+import io
+import logging
+import pstats
+import random
+import time
+from bisect import bisect_left
+from typing import Any, Awaitable, Callable
+
+from aiohttp import web
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.types import TelegramObject, Update
+
+from config import (
+    METRICS_HOST,
+    METRICS_PORT,
+    SLOW_UPDATE_MS,
+    PROFILE_SAMPLE_RATE,
+)
+
+logger = logging.getLogger(__name__)
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+# ---------- PRIMITIVES ----------
+# Минимальные метрики в текстовом формате Prometheus. Все обновления идут
+# из потока event loop, поэтому блокировки не нужны.
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, label: str):
+        self.name, self.help, self.label = name, help, label
+        self.values: dict[str, float] = {}
+
+    def inc(self, value: str, amount: float = 1):
+        self.values[value] = self.values.get(value, 0) + amount
+
+    def render(self):
+        for value, count in self.values.items():
+            yield f'{self.name}{{{self.label}="{value}"}} {count}'
+
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str):
+        self.name, self.help = name, help
+        self.value = 0
+
+    def render(self):
+        yield f"{self.name} {self.value}"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, label: str):
+        self.name, self.help, self.label = name, help, label
+        self.series: dict[str, list] = {}  # value -> [buckets..., overflow, sum, count]
+
+    def observe(self, value: str, seconds: float):
+        series = self.series.get(value)
+        if series is None:
+            series = self.series[value] = [0] * (len(BUCKETS) + 3)
+        series[bisect_left(BUCKETS, seconds)] += 1
+        series[-2] += seconds
+        series[-1] += 1
+
+    def render(self):
+        for value, series in self.series.items():
+            cumulative = 0
+            for bound, count in zip(BUCKETS, series):
+                cumulative += count
+                yield f'{self.name}_bucket{{{self.label}="{value}",le="{bound}"}} {cumulative}'
+            yield f'{self.name}_bucket{{{self.label}="{value}",le="+Inf"}} {series[-1]}'
+            yield f'{self.name}_sum{{{self.label}="{value}"}} {series[-2]}'
+            yield f'{self.name}_count{{{self.label}="{value}"}} {series[-1]}'
+
+
+# ---------- METRICS ----------
+update_duration = Histogram("bot_update_duration_seconds", "Update processing time", "type")
+update_errors = Counter("bot_update_errors_total", "Updates that raised", "type")
+updates_in_flight = Gauge("bot_updates_in_flight", "Updates being processed")
+handler_duration = Histogram("bot_handler_duration_seconds", "Handler time", "handler")
+handler_errors = Counter("bot_handler_errors_total", "Handler exceptions", "handler")
+api_duration = Histogram("bot_api_request_duration_seconds", "Bot API call time", "method")
+api_errors = Counter("bot_api_errors_total", "Failed Bot API calls", "method")
+db_duration = Histogram("db_query_duration_seconds", "SQLite call time, incl. queueing", "query")
+
+REGISTRY = [
+    update_duration, update_errors, updates_in_flight,
+    handler_duration, handler_errors,
+    api_duration, api_errors,
+    db_duration,
+]
+
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ---------- DATABASE ----------
+def timed(fn):
+    # Обёртка для функций database.py: async-функции замеряются по await,
+    # запись через очередь — до commit (future, который она возвращает).
+    name = fn.__name__
+
+    if asyncio.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                db_duration.observe(name, time.perf_counter() - start)
+        return wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        future = fn(*args, **kwargs)
+        future.add_done_callback(
+            lambda _: db_duration.observe(name, time.perf_counter() - start)
+        )
+        return future
+    return wrapper
+
+
+# ---------- MIDDLEWARES ----------
+class UpdateMetrics(BaseMiddleware):
+    # outer-middleware на dp.update: время, ошибки и число апдейтов в работе,
+    # плюс лог медленных апдейтов с выборочным профилем cProfile.
+    # cProfile профилирует весь поток: пока выбранный апдейт ждёт на await,
+    # в профиль попадает всё, что event loop делает в это время, — другие
+    # апдейты, outbox, дайджесты. Это профиль цикла за время апдейта, а не
+    # самого апдейта; чтобы увидеть один хендлер отдельно, профилировать с
+    # UPDATES_CONCURRENCY=1 на тестовой нагрузке.
+    def __init__(self):
+        self.profiling = False
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: dict[str, Any],
+    ) -> Any:
+        kind = event.event_type
+        profiler, others = None, updates_in_flight.value
+        if PROFILE_SAMPLE_RATE and not self.profiling and random.random() < PROFILE_SAMPLE_RATE:
+            self.profiling = True
+            profiler = cProfile.Profile()
+            profiler.enable()
+
+        updates_in_flight.value += 1
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            update_errors.inc(kind)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            updates_in_flight.value -= 1
+            update_duration.observe(kind, elapsed)
+            if profiler is not None:
+                profiler.disable()
+                self.profiling = False
+            if SLOW_UPDATE_MS and elapsed * 1000 > SLOW_UPDATE_MS:
+                self.log_slow(event, kind, elapsed, profiler, others)
+
+    @staticmethod
+    def log_slow(event: Update, kind: str, elapsed: float, profiler, others: int):
+        logger.warning("Slow update %s (%s): %.1f ms", event.update_id, kind, elapsed * 1000)
+        if profiler is not None:
+            out = io.StringIO()
+            pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(20)
+            logger.warning(
+                "Event loop profile while update %s was running "
+                "(%d other updates in flight at start, plus background tasks):\n%s",
+                event.update_id, others, out.getvalue(),
+            )
+
+
+class HandlerMetrics(BaseMiddleware):
+    # inner-middleware на message/callback_query: здесь уже известен хендлер
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        name = data["handler"].callback.__name__
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            handler_errors.inc(name)
+            raise
+        finally:
+            handler_duration.observe(name, time.perf_counter() - start)
+
+
+class ApiMetrics(BaseRequestMiddleware):
+    async def __call__(self, make_request, bot: Bot, method):
+        name = method.__api_method__
+        start = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception:
+            api_errors.inc(name)
+            raise
+        finally:
+            api_duration.observe(name, time.perf_counter() - start)
+
+
+def setup_metrics(dp: Dispatcher, bot: Bot):
+    dp.update.outer_middleware(UpdateMetrics())
+    dp.message.middleware(HandlerMetrics())
+    dp.callback_query.middleware(HandlerMetrics())
+    bot.session.middleware(ApiMetrics())
+
+
+# ---------- SERVER ----------
+async def start_metrics_server():
+    if not METRICS_PORT:
+        return None
+
+    async def handle(request: web.Request) -> web.Response:
+        return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, METRICS_HOST, METRICS_PORT).start()
+    return runner
@@ -0,0 +1,106 @@
+import asyncio
+import logging
+import time
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+
+from broadcast import deliver
+from config import (
+    OUTBOX_CONCURRENCY,
+    OUTBOX_POLL_INTERVAL,
+    OUTBOX_MAX_ATTEMPTS,
+    OUTBOX_RETRY_DELAY,
+    OUTBOX_CLAIM_TTL,
+)
+from database import (
+    claim_outbox,
+    get_outbox,
+    mark_delivered,
+    mark_failed,
+    reschedule,
+)
+
+logger = logging.getLogger(__name__)
+
+_wakeup = asyncio.Event()
+
+
+def notify():
+    # разбудить воркер сразу после enqueue_message, не дожидаясь опроса
+    _wakeup.set()
+
+
+# ---------- WORKER ----------
+# Доставка «как минимум один раз»: задание удаляется из outbox только после
+# ответа Telegram, поэтому после падения процесса оно будет отправлено
+# снова. В каждый чат одновременно уходит не больше одного сообщения,
+# по порядку id, — и между процессами тоже: задание сначала занимается
+# через claim_outbox, отправляет только занявший. Вложения копируются из чата админа (copy_message): файл
+# не проходит через наш сервер.
+async def _send(bot: Bot, outbox_id: int, message_id: int, chat_id: int, attempts: int,
+                text: str, from_chat_id=None, from_message_id=None):
+    if from_chat_id is None:
+        send = lambda cid: bot.send_message(cid, text)
+    else:
+        send = lambda cid: bot.copy_message(cid, from_chat_id, from_message_id)
+    # половина claim — запас на саму отправку и mark_delivered
+    delivery = await deliver(chat_id, send, OUTBOX_CLAIM_TTL / 2)
+    if delivery.ok:
+        await mark_delivered(outbox_id, message_id, delivery.result.message_id)
+        return
+
+    attempts += delivery.attempts
+    transient = isinstance(
+        delivery.error,
+        (TelegramNetworkError, TelegramServerError, TelegramRetryAfter, asyncio.TimeoutError),
+    )
+    if transient and attempts < OUTBOX_MAX_ATTEMPTS:
+        delay = OUTBOX_RETRY_DELAY * 2 ** min(attempts, 10)
+        if isinstance(delivery.error, TelegramRetryAfter):
+            delay = max(delay, delivery.error.retry_after)
+        await reschedule(outbox_id, attempts, time.time() + delay)
+    else:
+        logger.warning("Message %s to %s dropped: %r", message_id, chat_id, delivery.error)
+        await mark_failed(outbox_id, message_id)
+
+
+async def run_outbox(bot: Bot):
+    in_flight: set[int] = set()
+
+    def done(task, chat_id):
+        in_flight.discard(chat_id)
+        _wakeup.set()
+        if not task.cancelled() and task.exception():
+            logger.error("Outbox delivery to %s crashed", chat_id, exc_info=task.exception())
+
+    while True:
+        _wakeup.clear()
+        free = OUTBOX_CONCURRENCY - len(in_flight)
+        if free > 0:
+            try:
+                # свои занятые задания get_outbox уже не вернёт
+                rows = [row for row in await get_outbox(free) if row[2] not in in_flight]
+                claimed = set()
+                if rows:
+                    claimed = set(await claim_outbox([row[0] for row in rows], OUTBOX_CLAIM_TTL))
+            except Exception:
+                logger.exception("Outbox poll failed")
+                rows, claimed = [], set()
+            for outbox_id, message_id, chat_id, attempts, text, *source in rows:
+                if outbox_id not in claimed:
+                    continue
+                in_flight.add(chat_id)
+                task = asyncio.create_task(
+                    _send(bot, outbox_id, message_id, chat_id, attempts, text, *source)
+                )
+                task.add_done_callback(lambda t, cid=chat_id: done(t, cid))
+
+        try:
+            await asyncio.wait_for(_wakeup.wait(), OUTBOX_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
@@ -0,0 +1,60 @@
+import json
+import time
+from typing import Any, Callable, Mapping, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import (
+    BaseStorage,
+    DefaultKeyBuilder,
+    KeyBuilder,
+    StateType,
+    StorageKey,
+)
+
+from database import (
+    get_fsm_state,
+    get_fsm_data,
+    set_fsm_state,
+    set_fsm_data,
+)
+
+
+# ---------- FSM STORAGE ----------
+class SQLiteStorage(BaseStorage):
+    # FSM-хранилище поверх chat.db: состояние переживает рестарт и видно
+    # всем процессам бота, работающим с одной базой. Записи ждут commit,
+    # так что следующий апдейт, попавший в другой процесс, уже их увидит.
+    # state_ttl: имя состояния -> сколько секунд оно живёт.
+    # stateless(key) -> True: у этого ключа состояний не бывает, get_state
+    # отвечает None без запроса в базу. aiogram читает состояние на каждом
+    # апдейте, а большинство апдейтов — сообщения клиентов.
+    def __init__(
+        self,
+        key_builder: Optional[KeyBuilder] = None,
+        state_ttl: Optional[Mapping[str, float]] = None,
+        stateless: Optional[Callable[[StorageKey], bool]] = None,
+    ):
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self.state_ttl = dict(state_ttl or {})
+        self.stateless = stateless
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        state = state.state if isinstance(state, State) else state
+        ttl = self.state_ttl.get(state)
+        expires_at = time.time() + ttl if ttl else None
+        await set_fsm_state(self.key_builder.build(key), state, expires_at)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        if self.stateless is not None and self.stateless(key):
+            return None
+        return await get_fsm_state(self.key_builder.build(key))
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        await set_fsm_data(self.key_builder.build(key), json.dumps(dict(data)))
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        data = await get_fsm_data(self.key_builder.build(key))
+        return json.loads(data) if data else {}
+
+    async def close(self) -> None:
+        pass
@@ -0,0 +1,63 @@
+"""Group-commit writer: cancelled waiters must not kill the writer thread.
+
+    python -m pytest tests
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="test-writer-"), "chat.db")
+
+import database  # noqa: E402
+
+
+def blocking_job(started: threading.Event, release: threading.Event):
+    def job(conn):
+        started.set()
+        release.wait(5)
+        return "done"
+    return job
+
+
+async def write_after_cancel(cancel_running: bool, client_id: int):
+    loop = asyncio.get_running_loop()
+    started, release = threading.Event(), threading.Event()
+    blocker = database._submit(blocking_job(started, release))
+    await loop.run_in_executor(None, started.wait, 5)
+
+    if cancel_running:
+        victim = blocker  # задача уже выполняется
+    else:
+        victim = database._execute("INSERT INTO meta (key, value) VALUES ('cancelled', 1)")
+    victim.cancel()
+    await asyncio.sleep(0.1)  # отмена доходит до concurrent Future через loop
+    release.set()
+
+    assert await asyncio.wait_for(database.get_or_create_client(client_id, "client"), 5) == 1
+    assert database._writer.is_alive()
+    return await database._fetchone("SELECT 1 FROM meta WHERE key = 'cancelled'")
+
+
+def test_cancel_running_write():
+    asyncio.run(write_after_cancel(cancel_running=True, client_id=1))
+
+
+def test_cancel_queued_write_is_skipped():
+    assert asyncio.run(write_after_cancel(cancel_running=False, client_id=2)) is None
+
+
+def test_write_after_close_fails():
+    # последний: закрывает базу модуля
+    async def write():
+        return await asyncio.wait_for(database.get_or_create_client(3, "client"), 5)
+
+    database.close()
+    try:
+        asyncio.run(write())
+    except RuntimeError as e:
+        assert "closed" in str(e)
+    else:
+        raise AssertionError("write after close() succeeded")
@@ -0,0 +1,101 @@
+import asyncio
+from typing import Any
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.methods import TelegramMethod
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+from config import (
+    WEBHOOK_URL,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    WEBAPP_HOST,
+    WEBAPP_PORT,
+    UPDATES_CONCURRENCY,
+)
+
+
+# ---------- HANDLER ----------
+class BoundedRequestHandler(SimpleRequestHandler):
+    # Апдейт обрабатывается в фоне, как в SimpleRequestHandler, но не больше
+    # `concurrency` одновременно. Когда все слоты заняты, ответ Telegram
+    # задерживается до освобождения слота — Telegram сам придержит новые
+    # апдейты (не больше max_connections параллельных запросов).
+    # Переопределяет приватные _handle_request_background и
+    # _background_feed_update_tasks из aiogram 3.x — поэтому версия aiogram
+    # закреплена в requirements.txt; при обновлении сверить с
+    # SimpleRequestHandler.
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, concurrency: int, **kwargs: Any):
+        super().__init__(dispatcher=dispatcher, bot=bot, handle_in_background=True, **kwargs)
+        self.slots = asyncio.Semaphore(concurrency)
+        self.in_flight = 0
+
+    async def _feed(self, bot: Bot, update: dict):
+        try:
+            result = await self.dispatcher.feed_raw_update(bot=bot, update=update, **self.data)
+            if isinstance(result, TelegramMethod):
+                await self.dispatcher.silent_call_request(bot=bot, result=result)
+        finally:
+            self.in_flight -= 1
+            self.slots.release()
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        update = await request.json(loads=bot.session.json_loads)
+        await self.slots.acquire()
+        self.in_flight += 1
+        task = asyncio.create_task(self._feed(bot, update))
+        self._background_feed_update_tasks.add(task)
+        task.add_done_callback(self._background_feed_update_tasks.discard)
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+
+# ---------- SERVER ----------
+def check_config():
+    # Несколько воркеров за одним URL: set_webhook каждого перезаписывает
+    # secret_token, поэтому он общий и задаётся явно, а не генерируется.
+    missing = [name for name, value in (
+        ("WEBHOOK_URL", WEBHOOK_URL), ("WEBHOOK_SECRET", WEBHOOK_SECRET),
+    ) if not value]
+    if missing:
+        raise RuntimeError(f"BOT_MODE=webhook: не заданы {', '.join(missing)}")
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot, stop: asyncio.Event, **kwargs: Any):
+    # Работает до stop (SIGTERM/SIGINT в bot.main), затем останавливает сервер.
+    check_config()
+    secret = WEBHOOK_SECRET
+
+    app = web.Application()
+    handler = BoundedRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        concurrency=UPDATES_CONCURRENCY,
+        secret_token=secret,
+        **kwargs,
+    )
+    handler.register(app, path=WEBHOOK_PATH)
+
+    async def health(request: web.Request) -> web.Response:
+        return web.json_response({"status": "ok", "in_flight": handler.in_flight})
+
+    app.router.add_get("/healthz", health)
+
+    async def on_startup(bot: Bot):
+        await bot.set_webhook(
+            WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+            secret_token=secret,
+            allowed_updates=dp.resolve_used_update_types(),
+            max_connections=min(UPDATES_CONCURRENCY, 100),
+        )
+
+    dp.startup.register(on_startup)
+    setup_application(app, dp, bot=bot, **kwargs)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, WEBAPP_HOST, WEBAPP_PORT).start()
+    try:
+        await stop.wait()
+    finally:
+        await runner.cleanup()